@@ -0,0 +1,100 @@
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+# Set up the argument parser
+parser = argparse.ArgumentParser(description='Write parameters for popgen simulations in one pass (no shell script).')
+
+# Define required arguments with named options
+parser.add_argument('--input_file',
+                    type=str,
+                    required=True,
+                    help='CSV file of parameter combinations (see example.csv)')
+parser.add_argument('--output_file',
+                    type=str,
+                    default="train.tsv",
+                    help='File name for output (.tsv)')
+parser.add_argument('--num_sims',
+                    type=int,
+                    required=True,
+                    help='Simulate each parameter combo this many times'
+                    )
+parser.add_argument('--sample_size',
+                    type=int,
+                    required=True,
+                    )
+parser.add_argument('--ploidy',
+                    type=int,
+                    default=2,
+                    )
+parser.add_argument('--chromosome_size',
+                    type=int,
+                    required=True,
+                    )
+parser.add_argument('--grid',
+                    action='store_true',
+                    help='Cross the distinct values of each column instead of using the rows as combos'
+                    )
+parser.add_argument('--seed',
+                    type=int,
+                    default=None,
+                    help='Entropy for numpy SeedSequence (default is random, and printed)'
+                    )
+
+args = parser.parse_args()
+start_time = time.perf_counter()
+
+columns = ['sim_id',
+           'sample_size',
+           'ploidy',
+           'chromosome_size',
+           'Ne',
+           'demography',
+           'recombination_rate',
+           'genetic_map',
+           'mutation_rate',
+           'gene_conversion_rate',
+           'mean_gene_conversion_tract',
+           'ancestry_random_seed',
+           'mutation_random_seed',
+           ]
+
+# keep the values as written, e.g. 5e-8
+combos = pd.read_csv(args.input_file, index_col=None, dtype=str, keep_default_na=False)
+combos['sample_size'] = str(args.sample_size)
+combos['ploidy'] = str(args.ploidy)
+combos['chromosome_size'] = str(args.chromosome_size)
+combos['Ne'] = [str(int(float(x))) for x in combos['Ne']]
+combos['mean_gene_conversion_tract'] = [str(int(float(x))) for x in combos['mean_gene_conversion_tract']]
+combos = combos[columns[1:-2]]
+
+# one row per combo
+if args.grid:
+    levels = [pd.unique(combos[column]) for column in combos.columns]
+    codes = np.meshgrid(*[np.arange(len(level)) for level in levels], indexing='ij')
+    combos = pd.DataFrame(dict((column, level[code.ravel()])
+                               for column, level, code in zip(combos.columns, levels, codes)))
+num_combos = combos.shape[0]
+num_rows = num_combos * args.num_sims
+combo = np.repeat(np.arange(num_combos), args.num_sims)
+
+# seeds from one SeedSequence
+# msprime takes 1 <= seed < 2**32
+seed_sequence = np.random.SeedSequence(args.seed)
+print('SeedSequence entropy', seed_sequence.entropy)
+rng = np.random.default_rng(seed_sequence)
+seeds = rng.integers(1, 2**32, size=(num_rows, 2))
+
+# the parameters of a combo are the same string for all its simulations
+prefixes = np.array(['\t'.join(values) for values in combos.itertuples(index=False)], dtype=object)
+rows = map('{}\t{}\t{}\t{}'.format,
+           range(num_rows),
+           prefixes[combo].tolist(),
+           seeds[:, 0].tolist(),
+           seeds[:, 1].tolist())
+with open(args.output_file, 'w') as f:
+    f.write('\t'.join(columns)); f.write('\n')
+    f.write('\n'.join(rows)); f.write('\n')
+
+print(num_rows, 'simulations in', '%.2f' % (time.perf_counter() - start_time), 'seconds')
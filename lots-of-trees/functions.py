@@ -1,6 +1,7 @@
 # Utility function for tree sequence projects
 # Seth Temple, sethtem@umich.edu
 
+import json
 import tskit
 import msprime
 import numpy as np
@@ -43,6 +44,77 @@ def make_adjacency_matrix_from_tree(tree,
                 adjacency_matrix[parent_row,child_row] = 1
     return adjacency_matrix
 
+def _tree_adjacency_coo(tree, upper=True):
+    '''Rows, columns, and node IDs of a tree adjacency matrix'''
+    sample_number = tree.num_samples()
+    node_ids = np.sort(tree.preorder())
+    parents = tree.parent_array[node_ids]
+    keep = parents >= sample_number
+    child_rows = np.nonzero(keep)[0]
+    parent_rows = np.searchsorted(node_ids, parents[keep])
+    diagonal = np.arange(node_ids.shape[0])
+    if upper:
+        rows = np.concatenate((diagonal, child_rows))
+        cols = np.concatenate((diagonal, parent_rows))
+    else:
+        rows = np.concatenate((diagonal, child_rows, parent_rows))
+        cols = np.concatenate((diagonal, parent_rows, child_rows))
+    return rows, cols, node_ids
+
+def make_sparse_adjacency_matrix_from_tree(tree, upper=True):
+    '''Make a sparse adjacency matrix from a tree with array indexing
+
+    Same entries as make_adjacency_matrix_from_tree,
+    built from tree.parent_array without a python loop over nodes
+
+    Parameters
+    ----------
+    tree : tskit.Tree
+    upper : bool
+        Only upper triangular if True
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix(dtype=np.int32)
+     (# of nodes) x (# of nodes) adjacency matrix
+    '''
+    rows, cols, node_ids = _tree_adjacency_coo(tree, upper)
+    node_number = node_ids.shape[0]
+    data = np.ones(rows.shape[0], dtype=np.int32)
+    return sp.csr_matrix((data, (rows, cols)), shape=(node_number, node_number))
+
+def make_sparse_adjacency_matrices_from_tree_sequence(trees, upper=True):
+    '''Make one block-diagonal adjacency matrix for every tree
+
+    Parameters
+    ----------
+    trees : tskit.TreeSequence
+    upper : bool
+        Only upper triangular if True
+
+    Returns
+    -------
+    tuple
+        scipy.sparse.csr_matrix(dtype=np.int32) with one block per tree,
+        numpy.array of block offsets (tree i is rows offsets[i]:offsets[i+1]),
+        numpy.array of the node ID for each row
+    '''
+    all_rows = []
+    all_cols = []
+    all_ids = []
+    offsets = [0]
+    for tree in trees.trees():
+        rows, cols, node_ids = _tree_adjacency_coo(tree, upper)
+        all_rows.append(rows + offsets[-1])
+        all_cols.append(cols + offsets[-1])
+        all_ids.append(node_ids)
+        offsets.append(offsets[-1] + node_ids.shape[0])
+    rows = np.concatenate(all_rows)
+    cols = np.concatenate(all_cols)
+    data = np.ones(rows.shape[0], dtype=np.int32)
+    adjacency_matrix = sp.csr_matrix((data, (rows, cols)), shape=(offsets[-1], offsets[-1]))
+    return adjacency_matrix, np.array(offsets), np.concatenate(all_ids)
+
 def branch_grafted_onto(sample_id, tree):
     '''Determine edge that sample is grafted onto
 
@@ -88,7 +160,7 @@ def down_to_mrca(node_id, tree, trees, max_itr=100):
 
         # worry about while loop dev
         if itr > max_itr:
-            raise(TimeoutError,"Too many iterations")
+            raise TimeoutError("Too many iterations")
         itr += 1 
 
         kids = tree.children(elder)
@@ -132,7 +204,7 @@ def up_to_mrca(node_id, tree, trees, max_itr=100):
 
         # worry about while loop dev
         if itr > max_itr:
-            raise(TimeoutError,"Too many iterations")
+            raise TimeoutError("Too many iterations")
         itr += 1 
 
         # scan for non recombinant / common ancestor node
@@ -141,4 +213,196 @@ def up_to_mrca(node_id, tree, trees, max_itr=100):
             condition = False
         kid = elder
 
-    return elder
\ No newline at end of file
+    return elder
+
+def down_to_mrca_array(node_ids, tree, trees, max_itr=100):
+    '''Vectorized down_to_mrca for many node IDs at once
+
+    Parameters
+    ----------
+    node_ids : array-like
+    tree : tskit.Tree
+    trees : tskit.TreeSequence
+    max_itr : int
+        Addresses while loop
+
+    Returns
+    -------
+    numpy.array
+        (# of node IDs) x 2 node IDs, with -1 in the second
+        column if only one child was found (and -1 in both for leaves)
+    '''
+    left_child = tree.left_child_array
+    right_sib = tree.right_sib_array
+    flags = trees.nodes_flags
+    elder = np.array(node_ids, dtype=np.int32).ravel()
+    kids = np.full((elder.shape[0], 2), -1, dtype=np.int32)
+    active = np.arange(elder.shape[0])
+
+    for _ in range(max_itr):
+        kid0 = left_child[elder[active]]
+        kid1 = np.where(kid0 >= 0, right_sib[kid0], -1)
+        # two children, or a leaf
+        two = kid1 >= 0
+        kids[active[two], 0] = kid0[two]
+        kids[active[two], 1] = kid1[two]
+        done = two | (kid0 < 0)
+        # scan for non recombinant / common ancestor node
+        one = ~done & (flags[kid0] <= 1)
+        kids[active[one], 0] = kid0[one]
+        done |= one
+        elder[active[~done]] = kid0[~done]
+        active = active[~done]
+        if active.shape[0] == 0:
+            return kids
+
+    # worry about while loop dev
+    if active.shape[0] > 0:
+        raise TimeoutError("Too many iterations")
+    return kids
+
+def up_to_mrca_array(node_ids, tree, trees, max_itr=100):
+    '''Vectorized up_to_mrca for many node IDs at once
+
+    Parameters
+    ----------
+    node_ids : array-like
+    tree : tskit.Tree
+    trees : tskit.TreeSequence
+    max_itr : int
+        Addresses while loop
+
+    Returns
+    -------
+    numpy.array
+        Node IDs (-1 if the root is passed)
+    '''
+    parent = tree.parent_array
+    flags = trees.nodes_flags
+    kid = np.array(node_ids, dtype=np.int32).ravel()
+    elders = np.full(kid.shape[0], -1, dtype=np.int32)
+    active = np.arange(kid.shape[0])
+
+    for _ in range(max_itr):
+        elder = parent[kid[active]]
+        # scan for non recombinant / common ancestor node
+        done = (elder < 0) | (flags[elder] <= 0)
+        elders[active] = elder
+        kid[active] = elder
+        active = active[~done]
+        if active.shape[0] == 0:
+            return elders
+
+    # worry about while loop dev
+    if active.shape[0] > 0:
+        raise TimeoutError("Too many iterations")
+    return elders
+
+def load_topologies(file):
+    '''Load topologies.npz from format-trees-data.py --topology_format edges
+
+    Also loads windows.npz from access-trees.py --index_range
+
+    Parameters
+    ----------
+    file : str
+
+    Returns
+    -------
+    dict
+        numpy.arrays for node, parent, time, offsets, intervals, num_nodes
+    '''
+    with np.load(file) as data:
+        return dict((key, data[key]) for key in data.files)
+
+def topology_edges(topologies, tree_index):
+    '''(node, parent, parent time) arrays of one tree
+
+    Parameters
+    ----------
+    topologies : dict
+        From load_topologies
+    tree_index : int
+        topology{i}.time.current is tree i - 1
+        and topology{i}.time.next is tree i
+        For windows.npz from access-trees.py,
+        windows[w] are the left, center, right tree_index
+
+    Returns
+    -------
+    tuple
+        numpy.arrays of nodes, parents, times
+    '''
+    start = topologies['offsets'][tree_index]
+    end = topologies['offsets'][tree_index + 1]
+    return (topologies['node'][start:end],
+            topologies['parent'][start:end],
+            topologies['time'][start:end])
+
+def densify_topology(topologies, tree_index):
+    '''Dense (# of nodes) x (# of nodes) matrix with parent times
+
+    Same as the topology*.npy files of the dense format
+    '''
+    nodes, parents, times = topology_edges(topologies, tree_index)
+    num_nodes = int(topologies['num_nodes'])
+    rank_topology = np.zeros((num_nodes, num_nodes))
+    rank_topology[nodes, parents] = times
+    return rank_topology
+
+def load_genotype_windows(prefix):
+    '''Memory map genotypes.bin and genotypes.json
+
+    Written by format-trees-data.py or neural-phase/simulate.py
+    with --genotype_format int8 or bits
+
+    Parameters
+    ----------
+    prefix : str
+        Path without .bin or .json
+
+    Returns
+    -------
+    dict
+        numpy.memmap of rows, numpy.array of window offsets,
+        format, and number of samples
+    '''
+    with open(prefix + '.json', 'r') as f:
+        windows = json.load(f)
+    num_samples = windows['num_samples']
+    if windows['format'] == 'bits':
+        row_bytes = (num_samples + 7) // 8
+        dtype = np.uint8
+    else:
+        row_bytes = num_samples
+        dtype = np.int8
+    num_rows = windows['offsets'][-1]
+    if num_rows > 0:
+        rows = np.memmap(prefix + '.bin', dtype=dtype, mode='r', shape=(num_rows, row_bytes))
+    else:
+        rows = np.zeros((0, row_bytes), dtype=dtype)
+    windows['rows'] = rows
+    windows['offsets'] = np.array(windows['offsets'])
+    return windows
+
+def genotype_window(windows, index):
+    '''Samples x markers genotypes of one window
+
+    A view into the file for int8, unpacked for bits
+
+    Parameters
+    ----------
+    windows : dict
+        From load_genotype_windows
+    index : int
+
+    Returns
+    -------
+    numpy.array
+    '''
+    start = windows['offsets'][index]
+    end = windows['offsets'][index + 1]
+    rows = windows['rows'][start:end]
+    if windows['format'] == 'bits':
+        rows = np.unpackbits(rows, axis=1, count=windows['num_samples'])
+    return rows.T
@@ -1,35 +1,136 @@
 # These rules handle tree sequence files
 
-rule simulate_trees:
+if simulate_workers > 0:
+
+    # all rows of the experiments table in one process
+    rule simulate_trees:
+        input:
+            file = micro,
+        output:
+            files = [folder + '/' + str(sim_id) + '/simulated.trees' for sim_id in sim_ids],
+        params:
+            folder = folder,
+        threads: simulate_workers
+        shell:
+            '''
+            python scripts/simulate-trees.py \
+                --experiments_file {input.file} \
+                --output_folder {params.folder} \
+                --num_workers {threads}
+            '''
+
+else:
+
+    # one row of the experiments table, found by sim_id
+    rule simulate_trees:
+        input:
+            file = micro,
+            index = folder + '/experiments.index.npy',
+        output:
+            file = '{folder}/{sim_id}/simulated.trees'
+        group: 'simulation'
+        shell:
+            '''
+            python scripts/simulate-trees.py \
+                --experiments_file {input.file} \
+                --experiments_index {input.index} \
+                --sim_ids {wildcards.sim_id} \
+                --output_folder {wildcards.folder}
+            '''
+
+# simulate, format, and (with batch_vcf) write vcfs of batch_size sim_ids
+# in one process, one rule per batch
+# rules without wildcards win over the per sim_id rules for the same files
+if batch_size > 0:
+
+    for b, batch in enumerate(batches):
+
+        rule:
+            name: 'simulate_batch' + str(b)
+            input:
+                file = micro,
+                index = folder + '/experiments.index.npy',
+            output:
+                [folder + '/' + str(sim_id) + '/' + output for sim_id in batch for output in batch_outputs],
+            params:
+                sim_ids = ' '.join(str(sim_id) for sim_id in batch),
+                folder = folder,
+                num_markers = num_markers,
+                topology_format = topology_format,
+                genotype_format = genotype_format,
+                vcf = '--vcf' if batch_vcf else '',
+            threads: max(simulate_workers, 1)
+            shell:
+                '''
+                python scripts/simulate-trees.py \
+                    --experiments_file {input.file} \
+                    --experiments_index {input.index} \
+                    --sim_ids {params.sim_ids} \
+                    --output_folder {params.folder} \
+                    --num_workers {threads} {params.vcf} \
+                    --num_markers {params.num_markers} \
+                    --topology_format {params.topology_format} \
+                    --genotype_format {params.genotype_format}
+                '''
+
+# (sim_id, byte offset) of each row in the experiments table
+rule index_experiments:
     input:
-        file = '{folder}/{sim_id}/parameters.tsv'
+        file = micro,
     output:
-        file = '{folder}/{sim_id}/simulated.trees'
+        file = folder + '/experiments.index.npy',
     shell:
         '''
         python scripts/simulate-trees.py \
-            --input_file {input.file} \
-            --output_file {output.file}
+            --experiments_file {input.file} \
+            --write_index {output.file}
         '''
 
-rule format_trees_data:
-    input:
-        file = '{folder}/{sim_id}/simulated.trees'
-    output:
-        # gt = '{folder}/{sim_id}/genotypes/genotypes1.csv',
-        # tp = '{folder}/{sim_id}/topologies/topology1.npy',
-        gtn = '{folder}/{sim_id}/genotypes/genotypes1.next.csv',
-        tpn = '{folder}/{sim_id}/topologies/topology1.next.npy',
-        tpc = '{folder}/{sim_id}/topologies/topology1.current.npy',
-    params:
-        num_markers = num_markers,
-    shell:
-        '''
-        python scripts/format-trees-data.py \
-            --input_file {input.file} \
-            --output_prefix {wildcards.folder}/{wildcards.sim_id} \
-            --num_markers {params.num_markers}
-        '''
+if topology_format == 'edges':
+
+    rule format_trees_data:
+        input:
+            file = '{folder}/{sim_id}/simulated.trees'
+        output:
+            gtn = '{folder}/{sim_id}/' + genotype_output,
+            tp = '{folder}/{sim_id}/topologies/topologies.npz',
+        params:
+            num_markers = num_markers,
+            genotype_format = genotype_format,
+        group: 'simulation'
+        shell:
+            '''
+            python scripts/format-trees-data.py \
+                --input_file {input.file} \
+                --output_prefix {wildcards.folder}/{wildcards.sim_id} \
+                --num_markers {params.num_markers} \
+                --topology_format edges \
+                --genotype_format {params.genotype_format}
+            '''
+
+else:
+
+    rule format_trees_data:
+        input:
+            file = '{folder}/{sim_id}/simulated.trees'
+        output:
+            # gt = '{folder}/{sim_id}/genotypes/genotypes1.csv',
+            # tp = '{folder}/{sim_id}/topologies/topology1.npy',
+            gtn = '{folder}/{sim_id}/' + genotype_output,
+            tpn = '{folder}/{sim_id}/topologies/topology1.time.next.npy',
+            tpc = '{folder}/{sim_id}/topologies/topology1.time.current.npy',
+        params:
+            num_markers = num_markers,
+            genotype_format = genotype_format,
+        group: 'simulation'
+        shell:
+            '''
+            python scripts/format-trees-data.py \
+                --input_file {input.file} \
+                --output_prefix {wildcards.folder}/{wildcards.sim_id} \
+                --num_markers {params.num_markers} \
+                --genotype_format {params.genotype_format}
+            '''
 
 rule access_trees:
     input:
@@ -52,16 +153,62 @@ rule access_trees:
             --trim_trees {params.trim_trees}
         '''
 
+# all windows of the first num_trees trees in one pass
+rule access_trees_windows:
+    input:
+        tree_sequence = '{folder}/{sim_id}/simulated.trees',
+    output:
+        windows = '{folder}/{sim_id}/windows.npz',
+    params:
+        trim_trees = trim_trees,
+        num_trees = num_trees,
+    shell:
+        '''
+        python scripts/access-trees.py \
+            --input_file {input.tree_sequence} \
+            --output_folder {wildcards.folder}/{wildcards.sim_id} \
+            --index_range 0 {params.num_trees} \
+            --trim_trees {params.trim_trees}
+        '''
+
+# simulated.samples is kept between runs, not an output
+# tsinfer and tsinfer_vcz append to their own timings files, as both can run at once
 rule tsinfer:
     input:
         file = '{folder}/{sim_id}/simulated.trees',
     output:
         file = '{folder}/{sim_id}/inferred.trees',
+    params:
+        samples = '{folder}/{sim_id}/simulated.samples',
+        timings = '{folder}/{sim_id}/tsinfer.timings.jsonl',
+        num_threads = tsinfer_threads,
+    threads: max(tsinfer_threads, 1)
+    shell:
+        '''
+        python scripts/tsinfer-trees.py \
+            --input_file {input.file} \
+            --output_file {output.file} \
+            --sample_data_file {params.samples} \
+            --num_threads {params.num_threads} \
+            --timings_file {params.timings}
+        '''
+
+rule tsinfer_vcz:
+    input:
+        file = '{folder}/{sim_id}/simulated.vcz',
+    output:
+        file = '{folder}/{sim_id}/inferred.vcz.trees',
+    params:
+        timings = '{folder}/{sim_id}/tsinfer.vcz.timings.jsonl',
+        num_threads = tsinfer_threads,
+    threads: max(tsinfer_threads, 1)
     shell:
         '''
         python scripts/tsinfer-trees.py \
             --input_file {input.file} \
-            --output_file {output.file}
+            --output_file {output.file} \
+            --num_threads {params.num_threads} \
+            --timings_file {params.timings}
         '''
 
 # eventually do a command line
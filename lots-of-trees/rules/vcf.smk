@@ -1,115 +1,64 @@
 # These rules handle VCF files
 
+# one pass, no plain .vcf, no bgzip or tabix
 rule trees_to_vcf:
     input:
         file = '{folder}/{sim_id}/simulated.trees'
     output:
-        file = '{folder}/{sim_id}/simulated.vcf'
-    shell:
-        '''
-        tskit vcf {input.file} > {output.file}
-        '''
-
-rule gzip_vcf:
-    input:
-        file = '{folder}/{sim_id}/simulated.vcf'
-    output:
-        file = '{folder}/{sim_id}/simulated.vcf.gz'
-    shell:
-        '''
-        bgzip {input.file}
-        '''
-
-rule tabix_vcf:
-    input:
-        file = '{folder}/{sim_id}/simulated.vcf.gz'
-    output:
-        file = '{folder}/{sim_id}/simulated.vcf.gz.tbi'
-    shell:
-        '''
-        tabix -fp vcf {input.file}
-        '''
-
-# rule vcf_to_zarr:
-#     input:
-#         file = '{folder}/{sim_id}/simulated.vcf.gz',        
-#         tbi = '{folder}/{sim_id}/simulated.vcf.gz.tbi',
-#     output:
-#         directory('{folder}/{sim_id}/simulated.zarr')
-#     shell:
-#         '''
-#         python -m bio2zarr vcf2zarr convert {input.file} {output}
-#         '''
-
-rule vcf_to_zarr:
-    input:
-        file = '{folder}/{sim_id}/simulated.vcf.gz',        
+        file = '{folder}/{sim_id}/simulated.vcf.gz',
         tbi = '{folder}/{sim_id}/simulated.vcf.gz.tbi',
-    output:
-        directory('{folder}/{sim_id}/simulated.vcz'),
-        # directory('{folder}/{sim_id}/simulated.zarr')
+    group: 'simulation'
     shell:
         '''
-        python -m bio2zarr vcf2zarr explode \
-            {input.file} \
-            {wildcards.folder}/{wildcards.sim_id}/simulated.exploded
-        python -m bio2zarr vcf2zarr encode \
-            {wildcards.folder}/{wildcards.sim_id}/simulated.exploded \
-            {output}
+        python scripts/write-vcf.py \
+            --input_file {input.file} \
+            --output_file {output.file}
         '''
 
-
-rule tree_to_vcf:
+# chunked genotypes straight from the tree sequence
+rule trees_to_vcz:
     input:
-        file = '{folder}/{sim_id}/{tree_id}/lcr.trees'
+        file = '{folder}/{sim_id}/simulated.trees',
     output:
-        file = '{folder}/{sim_id}/{tree_id}/lcr.vcf'
+        directory('{folder}/{sim_id}/simulated.vcz'),
+    threads: max(vcz_workers, 1)
     shell:
         '''
-        tskit vcf {input.file} > {output.file}
+        python scripts/trees-to-vcz.py \
+            --input_file {input.file} \
+            --output_file {output} \
+            --num_workers {threads}
         '''
 
-rule gzip_tree_vcf:
+# left, center, right regions of the whole tree sequence in one pass
+# same records as bcftools view -r of lcr.vcf.gz
+rule window_vcfs:
     input:
-        file = '{folder}/{sim_id}/{tree_id}/lcr.vcf'
+        file = '{folder}/{sim_id}/simulated.trees',
+        intervals = '{folder}/{sim_id}/{tree_id}/intervals.tsv',
     output:
-        file = '{folder}/{sim_id}/{tree_id}/lcr.vcf.gz'
+        left = '{folder}/{sim_id}/{tree_id}/left.vcf.gz',
+        center = '{folder}/{sim_id}/{tree_id}/center.vcf.gz',
+        right = '{folder}/{sim_id}/{tree_id}/right.vcf.gz',
     shell:
         '''
-        bgzip {input.file}
+        python scripts/write-vcf.py \
+            --input_file {input.file} \
+            --intervals_file {input.intervals} \
+            --output_folder {wildcards.folder}/{wildcards.sim_id}/{wildcards.tree_id}
         '''
 
-rule tabix_tree_vcf:
+# left, center, right regions of every window in windows.npz in one pass
+rule windows_vcfs:
     input:
-        file = '{folder}/{sim_id}/{tree_id}/lcr.vcf.gz'
+        file = '{folder}/{sim_id}/simulated.trees',
+        windows = '{folder}/{sim_id}/windows.npz',
     output:
-        file = '{folder}/{sim_id}/{tree_id}/lcr.vcf.gz.tbi'
+        directory('{folder}/{sim_id}/windows'),
     shell:
         '''
-        tabix -fp vcf {input.file}
-        '''
-
-rule subset_lcr_vcf:
-    input:
-        lcr = '{folder}/{sim_id}/{tree_id}/lcr.vcf.gz',
-        intervals = '{folder}/{sim_id}/{tree_id}/intervals.tsv',
-        tbi = '{folder}/{sim_id}/{tree_id}/lcr.vcf.gz.tbi',
-    output:
-        left = '{folder}/{sim_id}/{tree_id}/left.vcf.gz',
-        center = '{folder}/{sim_id}/{tree_id}/center.vcf.gz',
-        right = '{folder}/{sim_id}/{tree_id}/right.vcf.gz',
-    shell:
+        python scripts/write-vcf.py \
+            --input_file {input.file} \
+            --windows_file {input.windows} \
+            --output_folder {output}
         '''
-        left_start=$(cut -f 2 {input.intervals} | head -n 2 | tail -n 1)
-        center_start=$(cut -f 3 {input.intervals} | head -n 2 | tail -n 1)
-        right_start=$(cut -f 4 {input.intervals} | head -n 2 | tail -n 1)
-        left_end=$(cut -f 2 {input.intervals} | tail -n 1)
-        center_end=$(cut -f 3 {input.intervals} | tail -n 1)
-        right_end=$(cut -f 4 {input.intervals} | tail -n 1)
-        bcftools view -Oz -o {output.left} \
-            -r 1:$left_start-$left_end {input.lcr}
-        bcftools view -Oz -o {output.center} \
-            -r 1:$center_start-$center_end {input.lcr}
-        bcftools view -Oz -o {output.right} \
-            -r 1:$right_start-$right_end {input.lcr}
-        '''
\ No newline at end of file
@@ -1,4 +1,6 @@
+import sys
 import argparse
+import numpy as np
 import msprime
 import tskit
 import pickle
@@ -16,10 +18,19 @@ parser.add_argument('--output_folder',
                     type=str, 
                     required=True, 
                     help='Folder name for output')
-parser.add_argument('--index_tree', 
-                    type=int, 
-                    required=True, 
-                    help='Index of trees in tree sequence')
+windows = parser.add_mutually_exclusive_group(required=True)
+windows.add_argument('--index_tree', 
+                     type=int, 
+                     help='Index of trees in tree sequence')
+windows.add_argument('--index_trees', 
+                     type=int, 
+                     nargs='+', 
+                     help='Many indices, written together to windows.npz')
+windows.add_argument('--index_range', 
+                     type=int, 
+                     nargs=2, 
+                     metavar=('START', 'END'), 
+                     help='Indices START, ..., END - 1, written together to windows.npz')
 parser.add_argument('--trim_trees', 
                     type=int, 
                     required=True, 
@@ -29,6 +40,50 @@ parser.add_argument('--trim_trees',
 args = parser.parse_args()
 input_file = args.input_file
 output_folder = args.output_folder
+
+if args.index_tree is None:
+    if args.index_trees is not None:
+        index_trees = np.array(args.index_trees)
+    else:
+        index_trees = np.arange(*args.index_range)
+    ts = tskit.load(input_file)
+    centers = index_trees + args.trim_trees
+    if centers.shape[0] == 0 or centers.min() < 1 or centers.max() > ts.num_trees - 2:
+        raise ValueError('center trees need a left and right tree')
+    node_times = ts.nodes_time
+
+    # one forward pass over the trees any window needs
+    # each tree is stored once, as (node, parent, parent time) triplets
+    needed = np.unique(np.concatenate((centers - 1, centers, centers + 1)))
+    all_edges = []
+    intervals = []
+    tree = ts.first()
+    for index in needed:
+        while tree.index < index:
+            tree.next()
+        nodes = tree.preorder()
+        parents = tree.parent_array[nodes]
+        keep = parents != tskit.NULL
+        all_edges.append((nodes[keep], parents[keep], node_times[parents[keep]]))
+        intervals.append((tree.interval.left, tree.interval.right))
+
+    # windows[w] are the rows of left, center, right trees
+    # (see topology_edges in functions.py)
+    lengths = [e[0].shape[0] for e in all_edges]
+    position = np.searchsorted(needed, centers)
+    np.savez(output_folder + '/windows.npz',
+             node=np.concatenate([e[0] for e in all_edges]).astype(np.int32),
+             parent=np.concatenate([e[1] for e in all_edges]).astype(np.int32),
+             time=np.concatenate([e[2] for e in all_edges]),
+             offsets=np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+             intervals=np.array(intervals),
+             num_nodes=ts.num_nodes,
+             tree_index=needed,
+             index_tree=index_trees,
+             windows=np.stack((position - 1, position, position + 1), axis=1),
+             )
+    sys.exit(0)
+
 index_tree = args.index_tree + args.trim_trees
 
 # process the trees
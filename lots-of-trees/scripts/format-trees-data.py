@@ -1,8 +1,10 @@
 import tskit
 # import msprime
 import numpy as np
-import sys
+import os
 import argparse
+import json
+from collections import deque
 
 # Set up the argument parser
 parser = argparse.ArgumentParser(description='Fill matrices for genotype data and rank order topology.')
@@ -10,89 +12,195 @@ parser = argparse.ArgumentParser(description='Fill matrices for genotype data an
 # Define required arguments with named options
 parser.add_argument('--input_file', 
                     type=str, 
+                    nargs='+', 
                     required=True, 
-                    help='File name for input')
+                    help='File name for input (many for a batch of simulations)')
 parser.add_argument('--output_prefix', 
                     type=str, 
+                    nargs='+', 
                     required=True, 
-                    help='Folder name for output')
+                    help='Folder name for output (one per input file)')
 parser.add_argument('--num_markers', 
                     type=int, 
                     required=True, 
                     help='How markers after tree right end to capture')
+parser.add_argument('--topology_format', 
+                    type=str, 
+                    default='dense', 
+                    choices=['dense', 'edges'],
+                    help='dense: two (nodes x nodes) .npy per tree; edges: one topologies.npz of (node, parent, time) triplets')
+parser.add_argument('--genotype_format', 
+                    type=str, 
+                    default='csv', 
+                    choices=['csv', 'int8', 'bits'],
+                    help='csv: one genotypes*.next.csv per tree; int8 or bits: one genotypes.bin with a genotypes.json index (bits is ancestral or derived)')
 # parser.add_argument('--rounding_number', 
 #                     type=int,
 #                     default=4,  
 #                     help='How many decimal places for the coalescent times')
 
-# Parse the arguments
-args = parser.parse_args()
-input_file = args.input_file
-output_prefix = args.output_prefix
-num_markers = args.num_markers
-
-trees = tskit.load(input_file)
-full_matrix = trees.genotype_matrix()
-
-# nodes in tree sequence should already be rank ordered
-assert np.all(np.diff(trees.tables.nodes.time) >= 0)
-
-# code to get the genotype matrices
-sites = trees.tables.sites.position
-num_trees = trees.num_trees
-num_nodes = trees.num_nodes
-itr = 0
-
-### SAVE THE CURRENT AND NEXT TREES AND THE NEXT XX MARKERS
-
-### THIS CREATES SOME REDUNDANT DATA STORAGE
-### BUT MAY BE MORE USER FRIENDLY
-
-for i in range(num_trees-1):
-
-    current_tree = trees.at_index(i)
-    next_tree = trees.at_index(i+1)
-
-    # initialize the topology
-    current_rank_topology = np.zeros((num_nodes,num_nodes))
-    next_rank_topology = np.zeros((num_nodes,num_nodes))
-
-    itr += 1
-    if itr < num_trees:
+def format_trees(input_file,
+                 output_prefix,
+                 num_markers,
+                 topology_format='dense',
+                 genotype_format='csv',
+                 ):
+    '''Write the genotype and topology data of one tree sequence'''
+
+    os.makedirs(output_prefix + '/genotypes', exist_ok=True)
+    os.makedirs(output_prefix + '/topologies', exist_ok=True)
+
+    trees = tskit.load(input_file)
+
+    # nodes in tree sequence should already be rank ordered
+    assert np.all(np.diff(trees.tables.nodes.time) >= 0)
+
+    num_nodes = trees.num_nodes
+    node_times = trees.nodes_time
+    itr = 0
+
+    # stream the variants once in a window that moves with the trees
+    variants = trees.variants()
+    window = deque()
+    exhausted = False
+
+    def markers_after(right):
+        '''Genotypes of the next num_markers sites after position right'''
+        nonlocal exhausted
+        while window and window[0][0] <= right:
+            window.popleft()
+        while not exhausted and len(window) < num_markers:
+            try:
+                variant = next(variants)
+            except StopIteration:
+                exhausted = True
+                break
+            if variant.site.position > right:
+                window.append((variant.site.position, variant.genotypes))
+        return [g for _, g in window]
+
+    def topology_edges(tree):
+        '''(node, parent, parent time) for every non-root node'''
+        nodes = tree.preorder()
+        parents = tree.parent_array[nodes]
+        keep = parents != tskit.NULL
+        nodes = nodes[keep]
+        parents = parents[keep]
+        return nodes, parents, node_times[parents]
+
+    def rank_topology(edges):
+        '''Parent times at [node, parent]'''
+        rank_topology = np.zeros((num_nodes,num_nodes))
+        nodes, parents, times = edges
+        rank_topology[nodes,parents] = times
+        return rank_topology
+
+    # binary genotypes append one window per tree to a single file
+    # markers are rows, packed along samples for bits
+    # bits is ancestral (0) or derived (1), as msprime sites can have more alleles
+    if genotype_format != 'csv':
+        genotype_file = open(output_prefix + '/genotypes/genotypes.bin', 'wb')
+    window_offsets = [0]
+
+    def write_window(sub_matrix):
+        if genotype_format == 'bits':
+            rows = np.packbits(sub_matrix > 0, axis=1)
+        else:
+            rows = sub_matrix.astype(np.int8)
+        genotype_file.write(rows.tobytes())
+        window_offsets.append(window_offsets[-1] + rows.shape[0])
+
+    # edges format keeps each tree once, for the whole simulation
+    all_edges = []
+    intervals = []
+
+    def keep_tree(tree, edges):
+        all_edges.append(edges)
+        intervals.append((tree.interval.left, tree.interval.right))
+
+    ### SAVE THE CURRENT AND NEXT TREES AND THE NEXT XX MARKERS
+
+    ### THIS CREATES SOME REDUNDANT DATA STORAGE
+    ### BUT MAY BE MORE USER FRIENDLY
+
+    # one forward pass, keeping what we need of the previous tree
+    tree_iterator = trees.trees()
+    current_tree = next(tree_iterator)
+    current_right = current_tree.interval.right
+    current_edges = topology_edges(current_tree)
+    if topology_format == 'edges':
+        keep_tree(current_tree, current_edges)
+
+    for next_tree in tree_iterator:
 
         # capture the marker data
-        right = current_tree.interval.right
-        mask = sites > right
-        try:
-            first_index = np.nonzero(mask)[0][0]
+        markers = markers_after(current_right)
         # happens at the last tree
-        except Exception as e:
-            sys.exit(0)
-        sites = sites[first_index:,]
-        sub_matrix = full_matrix[first_index:(first_index+num_markers)]
-        np.savetxt(output_prefix + '/genotypes/genotypes' + str(itr) + '.next.csv', 
-                   sub_matrix.T, # samples are rows, markers are columns
-                   delimiter=',',
-                   fmt='%.0f')
+        if len(markers) == 0:
+            break
+        itr += 1
+        sub_matrix = np.array(markers)
+        if genotype_format == 'csv':
+            np.savetxt(output_prefix + '/genotypes/genotypes' + str(itr) + '.next.csv', 
+                       sub_matrix.T, # samples are rows, markers are columns
+                       delimiter=',',
+                       fmt='%.0f')
+        else:
+            write_window(sub_matrix)
 
         # for single tree get the topology
-        root = current_tree.get_root()
-        nodes = [n for n in current_tree.nodes() if n != root]
-        parents = [current_tree.get_parent(n) for n in nodes]
-        times = [trees.get_time(p) for p in parents]
-        current_rank_topology[nodes,parents] = times
-        np.save(output_prefix + '/topologies/topology' + str(itr) + '.time.current.npy', 
-                current_rank_topology)
-        # for single tree get the topology
-        root = next_tree.get_root()
-        nodes = [n for n in next_tree.nodes() if n != root]
-        parents = [next_tree.get_parent(n) for n in nodes]
-        times = [trees.get_time(p) for p in parents]
-        next_rank_topology[nodes,parents] = times
-        np.save(output_prefix + '/topologies/topology' + str(itr) + '.time.next.npy', 
-                next_rank_topology)
-    else:
-        pass
+        next_edges = topology_edges(next_tree)
+        if topology_format == 'edges':
+            keep_tree(next_tree, next_edges)
+        else:
+            np.save(output_prefix + '/topologies/topology' + str(itr) + '.time.current.npy', 
+                    rank_topology(current_edges))
+            np.save(output_prefix + '/topologies/topology' + str(itr) + '.time.next.npy', 
+                    rank_topology(next_edges))
+
+        current_right = next_tree.interval.right
+        current_edges = next_edges
+
+    # window i is genotypes{i+1}.next.csv
+    # (see genotype_window in functions.py)
+    if genotype_format != 'csv':
+        genotype_file.close()
+        with open(output_prefix + '/genotypes/genotypes.json', 'w') as f:
+            json.dump({'format': genotype_format,
+                       'num_samples': trees.num_samples,
+                       'offsets': window_offsets,
+                       }, f)
+
+    # topology{itr}.time.current is tree itr - 1
+    # and topology{itr}.time.next is tree itr
+    # (see load_topology in functions.py)
+    if topology_format == 'edges':
+        lengths = [e[0].shape[0] for e in all_edges]
+        np.savez(output_prefix + '/topologies/topologies.npz',
+                 node=np.concatenate([e[0] for e in all_edges]).astype(np.int32),
+                 parent=np.concatenate([e[1] for e in all_edges]).astype(np.int32),
+                 time=np.concatenate([e[2] for e in all_edges]),
+                 offsets=np.concatenate(([0], np.cumsum(lengths))).astype(np.int64),
+                 intervals=np.array(intervals),
+                 num_nodes=num_nodes,
+                 )
+
+
+if __name__ == '__main__':
+
+    # Parse the arguments
+    args = parser.parse_args()
+    if len(args.input_file) != len(args.output_prefix):
+        parser.error('need one --output_prefix per --input_file')
+
+    # many simulations in one process
+    for input_file, output_prefix in zip(args.input_file, args.output_prefix):
+        format_trees(input_file,
+                     output_prefix,
+                     args.num_markers,
+                     args.topology_format,
+                     args.genotype_format,
+                     )
 
 
 ### SAVE ONLY THE CURRENT TREE AND NEXT XX MARKERS DATA
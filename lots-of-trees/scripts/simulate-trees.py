@@ -1,5 +1,13 @@
+import os
+import sys
+import csv
 import msprime
 import argparse
+import importlib
+import numpy as np
+from multiprocessing import Pool
+from vcfgz import write_vcf_gz # must be in same folder
+format_trees = importlib.import_module('format-trees-data').format_trees # must be in same folder
 
 # Set up the argument parser
 parser = argparse.ArgumentParser(description='Simulate trees with msprime.')
@@ -7,78 +15,235 @@ parser = argparse.ArgumentParser(description='Simulate trees with msprime.')
 # Define required arguments with named options
 parser.add_argument('--input_file', 
                     type=str, 
-                    required=True, 
-                    help='File name for input')
+                    help='File name for input (parameters.tsv of one simulation)')
 parser.add_argument('--output_file', 
                     type=str, 
-                    required=True, 
                     help='File name for output')
+parser.add_argument('--experiments_file',
+                    type=str,
+                    help='Simulate many rows of the experiments table (train.tsv) in one process')
+parser.add_argument('--output_folder',
+                    type=str,
+                    help='With --experiments_file, write {output_folder}/{sim_id}/simulated.trees')
+parser.add_argument('--sim_ids',
+                    type=int,
+                    nargs='+',
+                    default=None,
+                    help='With --experiments_file, only these sim_id (default is all rows)')
+parser.add_argument('--experiments_index',
+                    type=str,
+                    default=None,
+                    help='(sim_id, byte offset) .npy from --write_index, to read only the rows of --sim_ids')
+parser.add_argument('--write_index',
+                    type=str,
+                    default=None,
+                    help='With --experiments_file, only write its (sim_id, byte offset) .npy here')
+parser.add_argument('--vcf',
+                    action='store_true',
+                    help='With --experiments_file, also write simulated.vcf.gz and .tbi')
+parser.add_argument('--num_workers',
+                    type=int,
+                    default=1,
+                    help='With --experiments_file, simulations run in parallel')
+parser.add_argument('--num_markers',
+                    type=int,
+                    default=None,
+                    help='With --experiments_file, also run format-trees-data.py on each simulation')
+parser.add_argument('--topology_format',
+                    type=str,
+                    default='dense',
+                    choices=['dense', 'edges'],
+                    help='With --num_markers, as in format-trees-data.py')
+parser.add_argument('--genotype_format',
+                    type=str,
+                    default='csv',
+                    choices=['csv', 'int8', 'bits'],
+                    help='With --num_markers, as in format-trees-data.py')
 
+def simulate(output_file,
+             sample_size,
+             ploidy,
+             chromosome_size,
+             Ne,
+             recombination_rate,
+             mutation_rate,
+             gene_conversion_rate,
+             mean_gene_conversion_tract,
+             seed1,
+             seed2,
+             ):
+    '''Simulate a tree sequence with mutations and save it'''
 
+    # genetic map flexibility not implemented
+    # demography flexibility not implemented
 
-# Parse the arguments
-args = parser.parse_args()
-input_file = args.input_file
-output_file = args.output_file
-
-# Read in parameters
-f = open(input_file, 'r')
-line = f.readline()
-line = f.readline().strip().split('\t')
-sample_size = int(line[1])
-line = f.readline().strip().split('\t')
-ploidy = int(line[1])
-line = f.readline().strip().split('\t')
-chromosome_size = int(line[1])
-line = f.readline().strip().split('\t')
-Ne = int(line[1])
-line = f.readline().strip().split('\t')
-demography = line[1]
-line = f.readline().strip().split('\t')
-recombination_rate = float(line[1])
-line = f.readline().strip().split('\t')
-genetic_map = line[1]
-line = f.readline().strip().split('\t')
-mutation_rate = line[1] 
-line = f.readline().strip().split('\t')
-gene_conversion_rate = float(line[1])
-line = f.readline().strip().split('\t')
-mean_gene_conversion_tract = int(line[1])
-line = f.readline().strip().split('\t')
-seed1 = int(float(line[1]))
-line = f.readline().strip().split('\t')
-seed2 = int(float(line[1]))
-
-# genetic map flexibility not implemented
-# demography flexibility not implemented
-
-# Simulate a tree sequence
-ts = msprime.sim_ancestry(
-  samples = sample_size,
-  ploidy=int(ploidy),
-  population_size = Ne,
-  # demography = demography,
-  model=[
-    msprime.StandardCoalescent(),
-  ],
-  recombination_rate=recombination_rate,
-  # genetic_map=genetic_map,
-  sequence_length=chromosome_size,
-  gene_conversion_rate=gene_conversion_rate,
-  gene_conversion_tract_length=mean_gene_conversion_tract,
-  random_seed=seed1,
-)
-
-# root check
-roots = max(tree.num_roots for tree in ts.trees())
-if roots > 1:
-    raise ValueError('More than 1 root')
-
-# add neutral mutations
-mut_ts = msprime.sim_mutations(ts, 
-                               rate=mutation_rate, 
-                               keep=True,
-                               random_seed=seed2,
-                               )
-
-mut_ts.dump(output_file)
\ No newline at end of file
+    # Simulate a tree sequence
+    ts = msprime.sim_ancestry(
+      samples = sample_size,
+      ploidy=int(ploidy),
+      population_size = Ne,
+      # demography = demography,
+      model=[
+        msprime.StandardCoalescent(),
+      ],
+      recombination_rate=recombination_rate,
+      # genetic_map=genetic_map,
+      sequence_length=chromosome_size,
+      gene_conversion_rate=gene_conversion_rate,
+      gene_conversion_tract_length=mean_gene_conversion_tract,
+      random_seed=seed1,
+    )
+
+    # root check
+    roots = max(tree.num_roots for tree in ts.trees())
+    if roots > 1:
+        raise ValueError('More than 1 root')
+
+    # add neutral mutations
+    mut_ts = msprime.sim_mutations(ts,
+                                   rate=mutation_rate,
+                                   keep=True,
+                                   random_seed=seed2,
+                                   )
+
+    mut_ts.dump(output_file)
+    return mut_ts
+
+def index_experiments(experiments_file):
+    '''(sim_id, byte offset) of each row, sorted by sim_id'''
+    index = []
+    with open(experiments_file, 'rb') as f:
+        header = f.readline().rstrip(b'\r\n').split(b'\t')
+        column = header.index(b'sim_id')
+        offset = f.tell()
+        for line in f:
+            if line.strip():
+                index.append((int(line.split(b'\t')[column]), offset))
+            offset += len(line)
+    index = np.array(index, dtype=np.int64).reshape(-1, 2)
+    return index[np.argsort(index[:, 0], kind='stable')]
+
+def read_experiments(experiments_file, sim_ids=None, index=None):
+    '''Rows of the experiments table as dicts
+
+    With an index, seek to the rows of sim_ids instead of reading the table
+    '''
+    if index is None or sim_ids is None:
+        with open(experiments_file, 'r') as f:
+            rows = list(csv.DictReader(f, delimiter='\t'))
+        if sim_ids is not None:
+            sim_ids = set(str(sim_id) for sim_id in sim_ids)
+            rows = [row for row in rows if row['sim_id'] in sim_ids]
+        return rows
+    where = np.searchsorted(index[:, 0], sim_ids)
+    found = (where < index.shape[0]) & (index[np.minimum(where, index.shape[0] - 1), 0] == sim_ids)
+    if not np.all(found):
+        raise ValueError('sim_id not in experiments table: ' + str(np.array(sim_ids)[~found]))
+    rows = []
+    with open(experiments_file, 'r') as f:
+        header = f.readline().rstrip('\r\n').split('\t')
+        for offset in index[where, 1]:
+            f.seek(offset)
+            rows.append(dict(zip(header, f.readline().rstrip('\r\n').split('\t'))))
+    return rows
+
+def simulate_row(job):
+    '''Simulate one row of the experiments table
+
+    Optionally write its vcf and format its genotypes and topologies
+    '''
+    output_folder, row, vcf, formats = job
+    os.makedirs(output_folder + '/' + row['sim_id'], exist_ok=True)
+    output_file = output_folder + '/' + row['sim_id'] + '/simulated.trees'
+    ts = simulate(output_file,
+                  int(row['sample_size']),
+                  int(row['ploidy']),
+                  int(row['chromosome_size']),
+                  int(row['Ne']),
+                  float(row['recombination_rate']),
+                  float(row['mutation_rate']),
+                  float(row['gene_conversion_rate']),
+                  int(row['mean_gene_conversion_tract']),
+                  int(float(row['ancestry_random_seed'])),
+                  int(float(row['mutation_random_seed'])),
+                  )
+    if vcf:
+        write_vcf_gz(ts, [(output_folder + '/' + row['sim_id'] + '/simulated.vcf.gz', 1, int(ts.sequence_length) + 1)])
+    if formats is not None:
+        format_trees(output_file, output_folder + '/' + row['sim_id'], *formats)
+    return output_file
+
+if __name__ == '__main__':
+
+    # Parse the arguments
+    args = parser.parse_args()
+
+    if args.experiments_file is not None:
+        if args.write_index is not None:
+            np.save(args.write_index, index_experiments(args.experiments_file))
+            sys.exit(0)
+        if args.output_folder is None:
+            parser.error('--experiments_file needs --output_folder')
+        index = None
+        if args.experiments_index is not None:
+            index = np.load(args.experiments_index)
+        rows = read_experiments(args.experiments_file, args.sim_ids, index)
+        # each row keeps its own seeds, so the order of jobs does not matter
+        formats = None
+        if args.num_markers is not None:
+            formats = (args.num_markers, args.topology_format, args.genotype_format)
+        jobs = [(args.output_folder, row, args.vcf, formats) for row in rows]
+        if args.num_workers > 1:
+            with Pool(args.num_workers) as pool:
+                for output_file in pool.imap_unordered(simulate_row, jobs):
+                    pass
+        else:
+            for job in jobs:
+                simulate_row(job)
+
+    else:
+        if args.input_file is None or args.output_file is None:
+            parser.error('needs --input_file and --output_file, or --experiments_file')
+        input_file = args.input_file
+        output_file = args.output_file
+
+        # Read in parameters
+        f = open(input_file, 'r')
+        line = f.readline()
+        line = f.readline().strip().split('\t')
+        sample_size = int(line[1])
+        line = f.readline().strip().split('\t')
+        ploidy = int(line[1])
+        line = f.readline().strip().split('\t')
+        chromosome_size = int(line[1])
+        line = f.readline().strip().split('\t')
+        Ne = int(line[1])
+        line = f.readline().strip().split('\t')
+        demography = line[1]
+        line = f.readline().strip().split('\t')
+        recombination_rate = float(line[1])
+        line = f.readline().strip().split('\t')
+        genetic_map = line[1]
+        line = f.readline().strip().split('\t')
+        mutation_rate = line[1]
+        line = f.readline().strip().split('\t')
+        gene_conversion_rate = float(line[1])
+        line = f.readline().strip().split('\t')
+        mean_gene_conversion_tract = int(line[1])
+        line = f.readline().strip().split('\t')
+        seed1 = int(float(line[1]))
+        line = f.readline().strip().split('\t')
+        seed2 = int(float(line[1]))
+
+        simulate(output_file,
+                 sample_size,
+                 ploidy,
+                 chromosome_size,
+                 Ne,
+                 recombination_rate,
+                 mutation_rate,
+                 gene_conversion_rate,
+                 mean_gene_conversion_tract,
+                 seed1,
+                 seed2,
+                 )
@@ -0,0 +1,134 @@
+import argparse
+import numpy as np
+import tskit
+import zarr
+from multiprocessing import Pool
+from vcfgz import one_based # must be in same folder
+
+# Set up the argument parser
+parser = argparse.ArgumentParser(description='Write a tree sequence to a VCF Zarr (.vcz) store without a VCF.')
+
+# Define required arguments with named options
+parser.add_argument('--input_file',
+                    type=str,
+                    required=True,
+                    help='File name for input')
+parser.add_argument('--output_file',
+                    type=str,
+                    required=True,
+                    help='Folder name for output (.vcz)')
+parser.add_argument('--variants_chunk_size',
+                    type=int,
+                    default=10000,
+                    help='Sites per chunk')
+parser.add_argument('--samples_chunk_size',
+                    type=int,
+                    default=1000,
+                    help='Individuals per chunk')
+parser.add_argument('--num_workers',
+                    type=int,
+                    default=1,
+                    help='Variant chunks written in parallel')
+
+def individual_nodes(ts):
+    '''(individuals, ploidy) sample nodes in VCF column order, -1 pads
+
+    As in TreeSequence.write_vcf: individuals with sample nodes,
+    or one haploid individual per sample node if there are none
+    '''
+    nodes = ts.individuals_nodes
+    if nodes.shape[0] == 0:
+        return ts.samples()[:, np.newaxis]
+    is_sample = np.zeros(ts.num_nodes + 1, dtype=bool)
+    is_sample[ts.samples()] = True
+    nodes = np.where(is_sample[nodes], nodes, -1)
+    return nodes[np.any(nodes >= 0, axis=1)]
+
+def write_chunk(chunk):
+    '''Genotypes and alleles of the sites in one variant chunk'''
+    ts, root, nodes, variants_chunk_size = worker
+    start = chunk * variants_chunk_size
+    end = min(start + variants_chunk_size, ts.num_sites)
+    # column of each sample node in variant.genotypes
+    sample_index = np.full(ts.num_nodes + 1, -1)
+    sample_index[ts.samples()] = np.arange(ts.num_samples)
+    columns = sample_index[nodes]
+    padding = columns < 0
+
+    positions = ts.sites_position
+    left = positions[start]
+    right = positions[end] if end < ts.num_sites else ts.sequence_length
+    genotypes = np.zeros((end - start,) + nodes.shape, dtype=np.int8)
+    alleles = []
+    for i, variant in enumerate(ts.variants(left=left, right=right)):
+        genotypes[i] = variant.genotypes[columns]
+        alleles.append(['' if allele is None else allele for allele in variant.alleles])
+    genotypes[:, padding] = -2
+    max_alleles = root['variant_allele'].shape[1]
+    allele_array = np.array([a + [''] * (max_alleles - len(a)) for a in alleles], dtype=object)
+
+    root['call_genotype'][start:end] = genotypes
+    root['call_genotype_mask'][start:end] = genotypes < 0
+    root['variant_allele'][start:end] = allele_array.reshape(end - start, max_alleles)
+    return end - start
+
+def init_worker(input_file, output_file, nodes, variants_chunk_size):
+    global worker
+    worker = (tskit.load(input_file), zarr.open_group(output_file, mode='r+'), nodes, variants_chunk_size)
+
+if __name__ == '__main__':
+
+    args = parser.parse_args()
+    ts = tskit.load(args.input_file)
+    nodes = individual_nodes(ts)
+    num_variants = ts.num_sites
+    num_samples, ploidy = nodes.shape
+    max_alleles = max(2, max((1 + len(site.mutations) for site in ts.sites()), default=2))
+    variants_chunk = max(1, min(args.variants_chunk_size, num_variants))
+    samples_chunk = max(1, min(args.samples_chunk_size, num_samples))
+
+    root = zarr.open_group(args.output_file, mode='w')
+    root.attrs['vcf_zarr_version'] = '0.2'
+    root.attrs['source'] = 'tskit ' + tskit.__version__
+
+    def array(name, data=None, shape=None, dtype=None, chunks=None, dimensions=None):
+        if data is not None:
+            z = root.array(name, data, chunks=chunks, dtype=dtype)
+        else:
+            z = root.zeros(name, shape=shape, chunks=chunks, dtype=dtype)
+        z.attrs['_ARRAY_DIMENSIONS'] = dimensions
+        return z
+
+    # the same contig and one_based positions as write_vcf_gz
+    array('contig_id', np.array(['1'], dtype=object), dtype=str, dimensions=['contigs'])
+    array('contig_length', np.array([max(1, int(one_based([ts.sequence_length])[0]))]), dimensions=['contigs'])
+    array('sample_id', np.array(['tsk_' + str(j) for j in range(num_samples)], dtype=object),
+          dtype=str, chunks=(samples_chunk,), dimensions=['samples'])
+    array('variant_contig', np.zeros(num_variants, dtype=np.int8),
+          chunks=(variants_chunk,), dimensions=['variants'])
+    array('variant_position', one_based(ts.sites_position).astype(np.int32),
+          chunks=(variants_chunk,), dimensions=['variants'])
+    array('variant_ancestral_allele', np.array(ts.sites_ancestral_state, dtype=object) if num_variants else np.zeros(0, dtype=object),
+          dtype=str, chunks=(variants_chunk,), dimensions=['variants'])
+    array('variant_allele', shape=(num_variants, max_alleles), dtype=str,
+          chunks=(variants_chunk, max_alleles), dimensions=['variants', 'alleles'])
+    array('call_genotype', shape=(num_variants, num_samples, ploidy), dtype=np.int8,
+          chunks=(variants_chunk, samples_chunk, ploidy), dimensions=['variants', 'samples', 'ploidy'])
+    array('call_genotype_mask', shape=(num_variants, num_samples, ploidy), dtype=bool,
+          chunks=(variants_chunk, samples_chunk, ploidy), dimensions=['variants', 'samples', 'ploidy'])
+    array('call_genotype_phased', np.ones((num_variants, num_samples), dtype=bool),
+          chunks=(variants_chunk, samples_chunk), dimensions=['variants', 'samples'])
+
+    # each task fills whole variant chunks, so workers never share a chunk
+    num_chunks = -(-num_variants // variants_chunk)
+    init = (args.input_file, args.output_file, nodes, variants_chunk)
+    if args.num_workers > 1:
+        with Pool(args.num_workers, initializer=init_worker, initargs=init) as pool:
+            for _ in pool.imap_unordered(write_chunk, range(num_chunks)):
+                pass
+    else:
+        init_worker(*init)
+        for chunk in range(num_chunks):
+            write_chunk(chunk)
+
+    zarr.consolidate_metadata(args.output_file)
@@ -1,3 +1,6 @@
+import os
+import json
+import time
 import tsinfer
 import tskit
 import argparse
@@ -9,15 +12,65 @@ parser = argparse.ArgumentParser(description='Infer trees from simulated tree.')
 parser.add_argument('--input_file', 
                     type=str, 
                     required=True, 
-                    help='File name for input')
+                    help='File name for input (.trees, or .vcz from trees-to-vcz.py)')
 parser.add_argument('--output_file', 
                     type=str, 
                     required=True, 
                     help='File name for output')
+parser.add_argument('--sample_data_file',
+                    type=str,
+                    default=None,
+                    help='Keep the SampleData of a .trees input here (.samples), reused if newer than the input')
+parser.add_argument('--num_threads',
+                    type=int,
+                    default=0,
+                    help='Threads for generating and matching ancestors and samples (0 is tsinfer sequential)')
+parser.add_argument('--timings_file',
+                    type=str,
+                    default=None,
+                    help='Append per phase seconds as one JSON record per line')
+
+def timed(timings, phase, func, *args, **kwargs):
+    '''Run one phase of inference and record its seconds'''
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    timings[phase] = time.perf_counter() - start
+    print(phase, '%.3f seconds' % timings[phase])
+    return result
+
+def load_sample_data(input_file, sample_data_file=None):
+    '''VariantData for .vcz, otherwise SampleData, from disk if possible'''
+    if input_file.endswith('.vcz'):
+        return tsinfer.VariantData(input_file, 'variant_ancestral_allele')
+    if sample_data_file is not None:
+        if os.path.exists(sample_data_file) and \
+            os.path.getmtime(sample_data_file) >= os.path.getmtime(input_file):
+            return tsinfer.load(sample_data_file)
+        if os.path.exists(sample_data_file):
+            os.remove(sample_data_file)
+    ts = tskit.load(input_file)
+    return tsinfer.SampleData.from_tree_sequence(ts, path=sample_data_file)
 
 # infer the tree sequence
+# same phases as tsinfer.infer
 args = parser.parse_args()
-ts = tskit.load(args.input_file)
-sample_data = tsinfer.SampleData.from_tree_sequence(ts)
-inferred_ts = tsinfer.infer(sample_data)
+timings = {}
+sample_data = timed(timings, 'sample_data', load_sample_data,
+                    args.input_file, args.sample_data_file)
+ancestor_data = timed(timings, 'generate_ancestors', tsinfer.generate_ancestors,
+                      sample_data, num_threads=args.num_threads)
+ancestors_ts = timed(timings, 'match_ancestors', tsinfer.match_ancestors,
+                     sample_data, ancestor_data, num_threads=args.num_threads)
+inferred_ts = timed(timings, 'match_samples', tsinfer.match_samples,
+                    sample_data, ancestors_ts, num_threads=args.num_threads)
 inferred_ts.dump(args.output_file)
+
+if args.timings_file is not None:
+    record = {'input_file': args.input_file,
+              'num_threads': args.num_threads,
+              'num_sites': int(sample_data.num_sites),
+              'num_samples': int(sample_data.num_samples),
+              }
+    record.update(timings)
+    with open(args.timings_file, 'a') as f:
+        f.write(json.dumps(record)); f.write('\n')
@@ -0,0 +1,242 @@
+# Write bgzipped and tabix indexed VCF files in process
+# Replaces tskit vcf > .vcf, bgzip, tabix, and bcftools view -r
+
+import struct
+import zlib
+import numpy as np
+
+# bgzf blocks hold at most 64 KiB, leave room for incompressible data
+BLOCK_SIZE = 65280
+# empty block that ends every bgzf file
+EOF = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+class BgzfWriter:
+    '''Binary file of bgzf blocks
+
+    tell() is the virtual offset of the next byte:
+    (start of compressed block << 16) | offset in uncompressed block
+    '''
+
+    def __init__(self, file, level=6):
+        self.file = open(file, 'wb')
+        self.level = level
+        self.buffer = bytearray()
+        self.block_start = 0
+
+    def tell(self):
+        return (self.block_start << 16) | len(self.buffer)
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= BLOCK_SIZE:
+            self._write_block(bytes(self.buffer[:BLOCK_SIZE]))
+            del self.buffer[:BLOCK_SIZE]
+
+    def flush(self):
+        if len(self.buffer) > 0:
+            self._write_block(bytes(self.buffer))
+            self.buffer = bytearray()
+
+    def _write_block(self, data):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+        # gzip header with BC extra field holding the block size - 1
+        header = struct.pack('<4BI2BH2BHH', 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2,
+                             len(compressed) + 25)
+        footer = struct.pack('<2I', zlib.crc32(data), len(data))
+        self.file.write(header); self.file.write(compressed); self.file.write(footer)
+        self.block_start += len(header) + len(compressed) + len(footer)
+
+    def close(self):
+        self.flush()
+        self.file.write(EOF)
+        self.file.close()
+
+def reg2bin(beg, end):
+    '''Smallest tabix bin holding 0-based [beg, end)'''
+    end -= 1
+    if beg >> 14 == end >> 14: return ((1 << 15) - 1) // 7 + (beg >> 14)
+    if beg >> 17 == end >> 17: return ((1 << 12) - 1) // 7 + (beg >> 17)
+    if beg >> 20 == end >> 20: return ((1 << 9) - 1) // 7 + (beg >> 20)
+    if beg >> 23 == end >> 23: return ((1 << 6) - 1) // 7 + (beg >> 23)
+    if beg >> 26 == end >> 26: return ((1 << 3) - 1) // 7 + (beg >> 26)
+    return 0
+
+class VcfGzWriter:
+    '''Bgzipped VCF with its .tbi made while writing
+
+    Same as bgzip then tabix -p vcf, for records sorted by position
+    '''
+
+    def __init__(self, file, level=6):
+        self.file = file
+        self.bgzf = BgzfWriter(file, level)
+        self.contigs = []
+        self.bins = []
+        self.linear = []
+        self.extent = []
+
+    def write_header(self, lines):
+        self.bgzf.write(lines.encode())
+
+    def write_record(self, line):
+        '''One tab separated record ending in a newline'''
+        chrom, pos, _, ref, _ = line.split('\t', 4)
+        if chrom not in self.contigs:
+            self.contigs.append(chrom)
+            self.bins.append({})
+            self.linear.append([])
+            self.extent.append([None, None, 0])
+        beg = int(pos) - 1
+        end = beg + len(ref)
+        start = self.bgzf.tell()
+        self.bgzf.write(line.encode())
+        stop = self.bgzf.tell()
+        extent = self.extent[-1]
+        if extent[0] is None:
+            extent[0] = start
+        extent[1] = stop
+        extent[2] += 1
+
+        # chunks of consecutive records in a bin
+        chunks = self.bins[-1].setdefault(reg2bin(beg, end), [])
+        if len(chunks) > 0 and chunks[-1][1] == start:
+            chunks[-1][1] = stop
+        else:
+            chunks.append([start, stop])
+
+        # first record overlapping each 16 kb window
+        linear = self.linear[-1]
+        for window in range(beg >> 14, ((end - 1) >> 14) + 1):
+            while len(linear) <= window:
+                linear.append(None)
+            if linear[window] is None:
+                linear[window] = start
+
+    def close(self):
+        self.bgzf.close()
+        index = bytearray(b'TBI\x01')
+        names = b''.join(name.encode() + b'\x00' for name in self.contigs)
+        # vcf preset: columns 1 and 2, # for comments
+        index += struct.pack('<8i', len(self.contigs), 2, 1, 2, 0, ord('#'), 0, len(names))
+        index += names
+        for bins, linear, extent in zip(self.bins, self.linear, self.extent):
+            index += struct.pack('<i', len(bins) + 1)
+            for bin, chunks in sorted(bins.items()):
+                index += struct.pack('<Ii', bin, len(chunks))
+                for start, stop in chunks:
+                    index += struct.pack('<2Q', start, stop)
+            # pseudo bin with the file extent and record counts, as htslib writes
+            index += struct.pack('<Ii4Q', 37450, 2, extent[0], extent[1], extent[2], 0)
+            # empty windows point to the previous record
+            previous = 0
+            for window in range(len(linear)):
+                if linear[window] is None:
+                    linear[window] = previous
+                previous = linear[window]
+            index += struct.pack('<i', len(linear))
+            index += struct.pack('<%dQ' % len(linear), *linear)
+        # records without coordinates
+        index += struct.pack('<Q', 0)
+        tbi = BgzfWriter(self.file + '.tbi')
+        tbi.write(bytes(index))
+        tbi.close()
+
+class RegionSplitter:
+    '''File-like target of TreeSequence.write_vcf
+
+    Sends records to each (file, start, end) region they overlap,
+    1-based and inclusive like bcftools view -r
+    '''
+
+    def __init__(self, regions, level=6):
+        self.regions = sorted(regions, key=lambda region: region[1])
+        self.level = level
+        self.header = []
+        # write_vcf prints records a few fields at a time
+        self.pending = []
+        self.open = []
+        self.next = 0
+
+    def write(self, text):
+        if '\n' not in text:
+            self.pending.append(text)
+            return len(text)
+        self.pending.append(text)
+        lines = ''.join(self.pending).split('\n')
+        last = lines.pop()
+        self.pending = [last] if len(last) > 0 else []
+        for line in lines:
+            if line.startswith('#'):
+                self.header.append(line + '\n')
+            else:
+                self.write_record(line + '\n')
+        return len(text)
+
+    def write_record(self, line):
+        _, pos, _, ref, _ = line.split('\t', 4)
+        beg = int(pos)
+        end = beg + len(ref) - 1
+        # start regions at or before this record
+        while self.next < len(self.regions) and self.regions[self.next][1] <= end:
+            file, start, stop = self.regions[self.next]
+            writer = VcfGzWriter(file, self.level)
+            writer.write_header(''.join(self.header))
+            self.open.append((writer, start, stop))
+            self.next += 1
+        # finish regions ending before this record
+        still_open = []
+        for writer, start, stop in self.open:
+            if stop < beg:
+                writer.close()
+            else:
+                still_open.append((writer, start, stop))
+                if start <= end:
+                    writer.write_record(line)
+        self.open = still_open
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if len(''.join(self.pending)) > 0:
+            self.write('\n')
+        # regions after the last record still get a header
+        while self.next < len(self.regions):
+            file, start, stop = self.regions[self.next]
+            writer = VcfGzWriter(file, self.level)
+            writer.write_header(''.join(self.header))
+            self.open.append((writer, start, stop))
+            self.next += 1
+        for writer, start, stop in self.open:
+            writer.close()
+        self.open = []
+
+def one_based(positions):
+    '''Site positions plus one, so a site at 0 is POS 1
+
+    Used for every VCF and VCF Zarr output (see Coordinates in README.md)
+    '''
+    return 1 + np.round(np.asarray(positions))
+
+def write_vcf_gz(ts, regions, level=6, **kwargs):
+    '''One pass of ts.write_vcf into bgzipped, indexed region files
+
+    Positions are one_based unless position_transform is given,
+    as write_vcf raises on a site at 0
+
+    Parameters
+    ----------
+    ts : tskit.TreeSequence
+    regions : list
+        (file, start, end) with 1-based inclusive positions,
+        use (file, 1, ts.sequence_length + 1) for the whole VCF
+    level : int
+        zlib compression level
+    **kwargs
+        Passed to ts.write_vcf
+    '''
+    kwargs.setdefault('position_transform', one_based)
+    splitter = RegionSplitter(regions, level)
+    ts.write_vcf(splitter, **kwargs)
+    splitter.close()
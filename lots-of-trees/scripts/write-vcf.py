@@ -0,0 +1,64 @@
+import os
+import argparse
+import tskit
+import numpy as np
+from math import floor
+from vcfgz import write_vcf_gz # must be in same folder
+
+# Set up the argument parser
+parser = argparse.ArgumentParser(description='Write bgzipped and tabix indexed VCF files from a tree sequence in one pass.')
+
+# Define required arguments with named options
+parser.add_argument('--input_file',
+                    type=str,
+                    required=True,
+                    help='File name for input')
+parser.add_argument('--output_file',
+                    type=str,
+                    default=None,
+                    help='VCF of the whole tree sequence (.vcf.gz)')
+parser.add_argument('--intervals_file',
+                    type=str,
+                    default=None,
+                    help='intervals.tsv from access-trees.py, for left/center/right.vcf.gz in --output_folder')
+parser.add_argument('--windows_file',
+                    type=str,
+                    default=None,
+                    help='windows.npz from access-trees.py, for {index_tree}/left/center/right.vcf.gz in --output_folder')
+parser.add_argument('--output_folder',
+                    type=str,
+                    default=None,
+                    help='Folder name for region output')
+parser.add_argument('--level',
+                    type=int,
+                    default=6,
+                    help='zlib compression level')
+
+args = parser.parse_args()
+ts = tskit.load(args.input_file)
+
+# (file, start, end) regions as in bcftools view -r 1:start-end
+# of tskit positions, plus one as VCF positions are one_based
+regions = []
+if args.output_file is not None:
+    regions.append((args.output_file, 1, int(ts.sequence_length) + 1))
+if args.intervals_file is not None:
+    with open(args.intervals_file, 'r') as f:
+        f.readline()
+        starts = f.readline().strip().split('\t')[1:]
+        ends = f.readline().strip().split('\t')[1:]
+    for name, start, end in zip(['left', 'center', 'right'], starts, ends):
+        regions.append((args.output_folder + '/' + name + '.vcf.gz', int(start) + 1, int(end) + 1))
+if args.windows_file is not None:
+    with np.load(args.windows_file) as windows:
+        for index_tree, rows in zip(windows['index_tree'], windows['windows']):
+            for name, row in zip(['left', 'center', 'right'], rows):
+                left, right = windows['intervals'][row]
+                regions.append((args.output_folder + '/' + str(index_tree) + '/' + name + '.vcf.gz',
+                                floor(left) + 1, floor(right) + 1))
+if len(regions) == 0:
+    parser.error('needs --output_file, --intervals_file, or --windows_file')
+for file, start, end in regions:
+    os.makedirs(os.path.dirname(file) or '.', exist_ok=True)
+
+write_vcf_gz(ts, regions, args.level)
@@ -10,6 +10,7 @@ import msprime
 # i/o
 
 import argparse
+import json
 
 # Argument parser
 parser = argparse.ArgumentParser(description="Simulate genetic data using msprime.")
@@ -21,6 +22,8 @@ parser.add_argument("--mu", type=float, help="Mutation rate")
 parser.add_argument("--L", type=int, help="Sequence length")
 parser.add_argument("--num_sim", type=int, help="Simulations to run")
 parser.add_argument("--output", type=str, help="Output file prefix")
+parser.add_argument("--genotype_format", type=str, default="csv", choices=["csv", "int8", "bits"],
+                    help="csv: three .csv per simulation; int8 or bits: one _genotypes.bin, _genotypes.json, and _sites.npz")
 
 args = parser.parse_args()
 
@@ -34,6 +37,15 @@ m = ploidy * n
 
 K = args.num_sim
 output = args.output
+genotype_format = args.genotype_format
+
+# binary genotypes append one window per simulation to a single file
+# sites are rows, packed along samples for bits
+if genotype_format != "csv":
+    genotype_file = open(output + "_genotypes.bin", "wb")
+window_offsets = [0]
+all_positions = []
+all_frequencies = []
 
 for k in range(K):
 
@@ -72,6 +84,17 @@ for k in range(K):
     # compute allele frequencies
     biallelic_frequencies = biallelic_matrix.mean(axis=1)
 
+    if genotype_format != "csv":
+        if genotype_format == "bits":
+            rows = np.packbits(biallelic_matrix.astype(np.uint8), axis=1)
+        else:
+            rows = biallelic_matrix.astype(np.int8)
+        genotype_file.write(rows.tobytes())
+        window_offsets.append(window_offsets[-1] + rows.shape[0])
+        all_positions.append(biallelic_positions)
+        all_frequencies.append(biallelic_frequencies)
+        continue
+
     # save genotype matrix
     np.savetxt(output + "_genotypes_" + str(k) + ".csv", biallelic_matrix, delimiter=",", fmt="%d")
 
@@ -80,3 +103,18 @@ for k in range(K):
 
     # save biallelic frequencies
     np.savetxt(output + "_frequencies_" + str(k) + ".csv", biallelic_frequencies, delimiter=",", fmt="%.8f")
+
+# window k is simulation k
+# (see load_genotype_windows in lots-of-trees/functions.py)
+if genotype_format != "csv":
+    genotype_file.close()
+    with open(output + "_genotypes.json", "w") as f:
+        json.dump({"format": genotype_format,
+                   "num_samples": m,
+                   "offsets": window_offsets,
+                   }, f)
+    np.savez(output + "_sites.npz",
+             positions=np.concatenate(all_positions),
+             frequencies=np.concatenate(all_frequencies),
+             offsets=np.array(window_offsets, dtype=np.int64),
+             )
@@ -0,0 +1,170 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+import numpy as np
+import torch
+import torch.nn as nn
+from simple_selcoef import * # must be in same folder
+from simple_selcoef import _predict
+
+# Set up the argument parser
+parser = argparse.ArgumentParser(description='Benchmark the selection coefficient simulations and model.')
+
+# Define required arguments with named options
+parser.add_argument('--output_file',
+                    type=str,
+                    default='benchmark.jsonl',
+                    help='File name for output (one JSON record per line, appended)')
+parser.add_argument('--ne_files',
+                    type=str,
+                    nargs='+',
+                    default=['c10.ne'],
+                    help='*.ne files to benchmark')
+parser.add_argument('--constant_sizes',
+                    type=int,
+                    nargs='*',
+                    default=[1000, 10000, 100000],
+                    help='Also benchmark constant Ne of these sizes (make_constant_Ne)')
+parser.add_argument('--maxg',
+                    type=int,
+                    default=500,
+                    help='Maximum generation for --constant_sizes')
+parser.add_argument('--num_timed',
+                    type=int,
+                    default=5,
+                    help='Timed calls after one warm-up call (median is reported)')
+parser.add_argument('--num_scalar',
+                    type=int,
+                    default=50,
+                    help='Trajectories for walk_variant_backward')
+parser.add_argument('--num_batch',
+                    type=int,
+                    default=10000,
+                    help='Trajectories for walk_variants_backward')
+parser.add_argument('--num_rep',
+                    type=int,
+                    default=5,
+                    help='Replicates per (s, p) cell in bootstrap')
+parser.add_argument('--model_file',
+                    type=str,
+                    default=None,
+                    help='Saved torch model (default is a small network)')
+parser.add_argument('--num_rows',
+                    type=int,
+                    default=100000,
+                    help='Rows for model inference')
+parser.add_argument('--seed',
+                    type=int,
+                    default=123,
+                    help='Random seed')
+
+args = parser.parse_args()
+rng = np.random.default_rng(args.seed)
+np.random.seed(args.seed)
+torch.manual_seed(args.seed)
+
+# same settings as nn-selcoef.ipynb
+s = 0.02
+p = 0.3
+gens = np.arange(0,50,5)
+sizes = np.repeat(50, gens.shape[0])
+grid = (-0.1, 0.002, 0.1, 0.1, 0.025, 0.9)
+
+try:
+    commit = subprocess.run(['git', 'rev-parse', 'HEAD'],
+                            capture_output=True, text=True, check=True).stdout.strip()
+except (OSError, subprocess.CalledProcessError):
+    commit = None
+info = {'commit': commit,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'torch': torch.__version__,
+        'cpus': os.cpu_count(),
+        'seed': args.seed,
+        }
+
+def timed(name, units, num_units, func, **params):
+    '''Median seconds of a few calls after a warm-up, then peak memory of one more
+
+    The warm-up call leaves out numba compiling and torch start up
+    '''
+    func()
+    times = []
+    for _ in range(args.num_timed):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    seconds = float(np.median(times))
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    record = dict(info)
+    record.update({'benchmark': name,
+                   'params': params,
+                   'seconds': seconds,
+                   'seconds_timed': times,
+                   units + '_per_sec': num_units / seconds,
+                   'peak_memory_bytes': peak,
+                   })
+    print(name, params, '%.1f %s/sec' % (num_units / seconds, units))
+    return record
+
+records = []
+
+# *.ne files, then constant Ne of several sizes
+demographies = [({'ne_file': ne_file}, read_demography(ne_file)) for ne_file in args.ne_files]
+demographies += [({'constant_Ne': size, 'maxg': args.maxg}, make_constant_Ne(None, size, args.maxg))
+                 for size in args.constant_sizes]
+
+# trajectories per second
+for ne_params, Ne in demographies:
+    for ploidy in [1,2]:
+        for one_step_model in ['m','a','d','r']:
+            params = dict(ne_params, ploidy=ploidy, one_step_model=one_step_model)
+            records.append(timed('walk_variant_backward', 'trajectories', args.num_scalar,
+                                 lambda: [walk_variant_backward(s,p,Ne,True,one_step_model,ploidy=ploidy)
+                                          for _ in range(args.num_scalar)],
+                                 **params))
+            records.append(timed('walk_variants_backward', 'trajectories', args.num_batch,
+                                 lambda: walk_variants_backward(np.full(args.num_batch, s),p,Ne,True,one_step_model,
+                                                                ploidy=ploidy,rng=rng),
+                                 **params))
+
+# bootstrap rows per second
+for ne_params, Ne in demographies:
+    params = dict(ne_params, num_rep=args.num_rep)
+    s_start, s_step, s_end, p_start, p_step, p_end = grid
+    num_rows = args.num_rep * len(np.arange(s_start,s_end,s_step)) * len(np.arange(p_start,p_end,p_step))
+    records.append(timed('bootstrap', 'rows', num_rows,
+                         lambda: bootstrap(args.num_rep,*grid,Ne,gens,sizes),
+                         **params))
+    records.append(timed('bootstrap_shards', 'rows', num_rows,
+                         lambda: [x for x in bootstrap_shards(args.num_rep,*grid,Ne,gens,sizes,seed=args.seed)],
+                         **params))
+
+# model inference throughput
+if args.model_file is None:
+    model = nn.Sequential(nn.Linear(gens.shape[0], 32), nn.Tanh(),
+                          nn.Linear(32, 32), nn.Tanh(),
+                          nn.Linear(32, 1))
+else:
+    model = torch.load(args.model_file, weights_only=False)
+x = rng.random((args.num_rows, gens.shape[0])).astype(np.float32)
+params = {'model_file': args.model_file, 'num_rows': args.num_rows}
+records.append(timed('model_inference', 'rows', args.num_rows,
+                     lambda: model(torch.from_numpy(x)).detach().numpy(),
+                     **params))
+records.append(timed('model_inference_minibatch', 'rows', args.num_rows,
+                     lambda: _predict(model, x, 65536),
+                     **params))
+
+# append so runs on different versions line up
+with open(args.output_file, 'a') as f:
+    for record in records:
+        f.write(json.dumps(record)); f.write('\n')
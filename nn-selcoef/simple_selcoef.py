@@ -3,9 +3,23 @@
 
 import numpy as np
 import torch
+from torch.utils.data import Dataset, IterableDataset, get_worker_info
 from scipy.stats import binom
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from math import floor, ceil, sqrt
 import matplotlib.pyplot as plt
+from functools import lru_cache
+import hashlib
+import json
+import os
+try:
+    from numba import njit
+except ImportError: # run the kernels as plain python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda f: f
 
 def read_Ne(file):
     '''Read *.ne file
@@ -31,13 +45,118 @@ def read_Ne(file):
 
     return Ne
 
+class Demography:
+    '''Effective population sizes as a dense array
+
+    sizes[G] is the size at generation G, filled forward
+    from the last listed generation. Hashable, so it can
+    key caches of simulations.
+
+    Parameters
+    ----------
+    sizes : array-like
+        Sizes for generations 0, 1, ..., maxg
+    '''
+
+    def __init__(self, sizes):
+        sizes = np.array(sizes, dtype=np.int64).ravel()
+        assert sizes.shape[0] > 0
+        sizes.flags.writeable = False
+        self.sizes = sizes
+        self._hash = None
+
+    @classmethod
+    def from_dict(cls, Ne):
+        '''Fill forward a dict[generation] = size'''
+        gens = np.fromiter(Ne.keys(), dtype=np.int64)
+        vals = np.fromiter(Ne.values(), dtype=np.int64)
+        return cls.from_table(gens, vals)
+
+    @classmethod
+    def from_table(cls, gens, vals):
+        '''Fill forward sizes listed at some generations'''
+        order = np.argsort(gens, kind='stable')
+        gens = np.asarray(gens)[order]
+        vals = np.asarray(vals)[order]
+        assert gens[0] == 0
+        idx = np.searchsorted(gens, np.arange(gens[-1] + 1), side='right') - 1
+        return cls(vals[idx])
+
+    @property
+    def maxg(self):
+        return self.sizes.shape[0] - 1
+
+    def keys(self):
+        return range(self.sizes.shape[0])
+
+    def __getitem__(self, G):
+        return int(self.sizes[G])
+
+    def __len__(self):
+        return self.sizes.shape[0]
+
+    def __hash__(self):
+        if self._hash is None:
+            digest = hashlib.sha1(self.sizes.tobytes()).digest()
+            self._hash = int.from_bytes(digest[:8], 'little')
+        return self._hash
+
+    def __eq__(self, other):
+        if not isinstance(other, Demography):
+            return NotImplemented
+        return np.array_equal(self.sizes, other.sizes)
+
+    def __getstate__(self):
+        return {'sizes': self.sizes}
+
+    def __setstate__(self, state):
+        self.__init__(state['sizes'])
+
+    def __repr__(self):
+        return 'Demography(maxg=%d)' % self.maxg
+
+def as_demography(Ne):
+    '''Demography from a dict or Demography'''
+    if isinstance(Ne, Demography):
+        return Ne
+    return Demography.from_dict(Ne)
+
+_demography_cache = {}
+
+def read_demography(file):
+    '''Read *.ne file into a Demography
+
+    Cached on file path and modification time,
+    so repeated reads of the same file do not parse it again
+
+    Parameters
+    ----------
+    file : string
+        Input file name
+
+    Returns
+    -------
+    Demography
+    '''
+
+    path = os.path.abspath(file)
+    key = (path, os.stat(path).st_mtime_ns)
+    try:
+        return _demography_cache[key]
+    except KeyError:
+        pass
+    table = np.loadtxt(path, skiprows=1, usecols=(0,1), ndmin=2)
+    Ne = Demography.from_table(table[:,0].astype(np.int64), table[:,1].astype(np.int64))
+    _demography_cache[key] = Ne
+    return Ne
+
 def make_constant_Ne(file, size, maxg):
     '''Create *.ne file for constant size population
 
     Parameters
     ----------
     file: str
-        Output file name
+        Output file name (None to skip writing)
     size : float
         Effective population size
     maxg : int
@@ -45,19 +164,18 @@ def make_constant_Ne(file, size, maxg):
 
     Returns
     -------
-    NoneType
+    Demography
         Writes a *.ne file
     '''
 
     size = floor(size)
     maxg = floor(maxg)
-    with open(file, 'w') as f:
-        f.write('GEN\tNE\n')
-        f.write(str(0)); f.write('\t'); f.write(str(size)); f.write('\n')
-        for i in range(1, int(maxg) + 1):
-            f.write(str(i)); f.write('\t'); f.write(str(size)); f.write('\n')
+    Ne = Demography(np.full(maxg + 1, size))
+    if file is not None:
+        table = np.column_stack((np.arange(maxg + 1), Ne.sizes))
+        np.savetxt(file, table, fmt='%d', delimiter='\t', header='GEN\tNE', comments='')
 
-    return None
+    return Ne
 
 def walk_variant_backward(s, p0, Ne, random_walk = False, one_step_model = 'a', tau0 = 0, sv=-0.01, ploidy = 2):
     '''Variant frequencies backward in time
@@ -68,7 +186,7 @@ def walk_variant_backward(s, p0, Ne, random_walk = False, one_step_model = 'a',
         Selection coefficient
     p0 : float
         Variant frequency at generation 0
-    Ne : dict
+    Ne : dict or Demography
         Effective population sizes
     random_walk : bool
         True for random walk
@@ -148,7 +266,9 @@ def walk_variant_backward(s, p0, Ne, random_walk = False, one_step_model = 'a',
     Ns = [] # sizes
     t = floor(tau0)
     p = p0
-    N = Ne[0]
+    Ne = as_demography(Ne)
+    sizes = Ne.sizes.tolist()
+    N = sizes[0]
     x = floor(p * ploidy * N)
     Ns.append(N)
     xs.append(x)
@@ -156,11 +276,8 @@ def walk_variant_backward(s, p0, Ne, random_walk = False, one_step_model = 'a',
 
     if random_walk: # random walk
 
-        for G in range(1, max(Ne.keys())+1):
-            try: # population size change
-                N = Ne[G]
-            except KeyError:
-                pass
+        for G in range(1, len(sizes)):
+            N = sizes[G] # population size change
             if G > t:
                 p = one_step(p, s)
             x = int(binom.rvs(int(ploidy * N), p))
@@ -179,26 +296,264 @@ def walk_variant_backward(s, p0, Ne, random_walk = False, one_step_model = 'a',
 
     else: # deterministic
 
-        for G in range(1, max(Ne.keys())+1):
-            try: # population size change
-                N = Ne[G]
-            except KeyError:
-                pass
-            if G > t:
-                p = one_step(p, s)
-            x = floor(p * ploidy * N)
-            if x < 1:
-                break
-            if p >= 1:
-                break
-            if p <= sv:
-                s = 0
-            Ns.append(N)
-            xs.append(x)
-            ps.append(p)
+        ps = deterministic_trajectory(s, p0, Ne, one_step_model, tau0, sv, ploidy)
+        Ns = Ne.sizes[:ps.shape[0]]
+        xs = np.floor(ps * ploidy * Ns)
 
-        return np.array([np.array(ps), np.array(Ns), np.array(xs)]) # numpy-ify
+        return np.array([ps, Ns, xs]) # numpy-ify
     
+def _one_step_bwd(p, s, one_step_model = 'a', ploidy = 2):
+    '''One generation backward for arrays of frequencies'''
+    if ploidy == 1 or one_step_model == 'm':
+        # haploid is same as multiplicative (Felsenstein, 2017)
+        if ploidy == 1:
+            return p / (1 + s - s * p)
+        return p / (1 + (1 - p) * s)
+    pos = s > 0
+    sp = np.where(pos, s, 1.)
+    if one_step_model == 'a':
+        a = sp
+        b = 1 + sp - 2 * p * sp
+    elif one_step_model == 'd':
+        a = p * sp
+        b = 1 + sp - 2 * p * sp
+    else:
+        a = (1 - p) * sp
+        b = np.ones_like(p)
+    c = - p
+    with np.errstate(divide='ignore', invalid='ignore'):
+        qf = (- b + np.sqrt((b ** 2) - 4 * a * c)) / 2 / a
+    return np.where(pos, qf, p)
+
+def _global_rng():
+    '''Generator seeded from the global np.random state
+
+    So np.random.seed still reproduces the simulations
+    '''
+    return np.random.default_rng(np.random.randint(2**32))
+
+def walk_variants_backward(s, p0, Ne, random_walk = True, one_step_model = 'a', tau0 = 0, sv=-0.01, ploidy = 2, rng = None):
+    '''Many variant frequencies backward in time at once
+
+    Vectorized version of walk_variant_backward.
+    All replicates advance together as NumPy arrays,
+    and lost or fixed variants are masked out.
+
+    Parameters
+    ----------
+    s : float or numpy.ndarray
+        Selection coefficients
+    p0 : float or numpy.ndarray
+        Variant frequencies at generation 0
+    Ne : dict or Demography
+        Effective population sizes
+    random_walk : bool
+        True for random walk
+    one_step_model : str
+        'm', 'a', 'd', or 'r'
+    tau0 : int
+        Generation when neutrality begins
+    sv: float
+        Allele frequency of standing variation
+        (Default -0.01 will assume de novo sweep)
+    ploidy : int
+        1 for haploid or 2 for diploid
+    rng : numpy.random.Generator
+        Random number generator (Default None seeds one from np.random)
+
+    Returns
+    -------
+    tuple
+        (replicates) x (generations + 1) NumPy array of frequencies,
+        held at the last value after loss or fixation,
+        and NumPy array of trajectory lengths
+    '''
+
+    assert ploidy in [1,2]
+    assert one_step_model in ['m','a','r','d']
+    assert sv < 1
+    s, p0 = np.broadcast_arrays(np.asarray(s, dtype=float), np.asarray(p0, dtype=float))
+    s = s.ravel().copy()
+    p = p0.ravel().copy()
+    assert np.all(p <= 1)
+    assert np.all(p >= 0)
+    if rng is None:
+        rng = _global_rng()
+
+    sizes = as_demography(Ne).sizes
+    maxg = sizes.shape[0] - 1
+    R = p.shape[0]
+    t = floor(tau0)
+
+    # initialize
+    ps = np.empty((R, maxg + 1), dtype=float)
+    ps[:, 0] = p
+    lengths = np.ones(R, dtype=int)
+    active = np.arange(R)
+
+    for G in range(1, maxg + 1):
+        N = sizes[G]
+        pa = p[active]
+        sa = s[active]
+        if G > t:
+            pa = _one_step_bwd(pa, sa, one_step_model, ploidy)
+        if random_walk:
+            x = rng.binomial(int(ploidy * N), pa)
+            pa = x / ploidy / N
+        else:
+            x = np.floor(pa * ploidy * N)
+        keep = (x >= 1) & (pa < 1)
+        active = active[keep]
+        pa = pa[keep]
+        p[active] = pa
+        s[active] = np.where(pa <= sv, 0., s[active])
+        lengths[active] += 1
+        ps[:, G] = p
+        if active.shape[0] == 0:
+            ps[:, (G+1):] = p[:, None]
+            break
+
+    return ps, lengths
+
+def pad_trajectories(ps, gens):
+    '''Sample frequency trajectories at generations
+
+    Generations after loss, fixation, or the end of
+    the demography hold the last frequency
+
+    Parameters
+    ----------
+    ps : numpy.ndarray
+        (replicates) x (generations + 1) frequencies
+        from walk_variants_backward
+    gens : numpy.ndarray
+        Generations to sample
+
+    Returns
+    -------
+    numpy.ndarray
+        (replicates) x (len(gens)) frequencies
+    '''
+    idx = np.minimum(np.asarray(gens), ps.shape[-1] - 1)
+    return ps[..., idx]
+
+_one_step_codes = {'m':0, 'a':1, 'd':2, 'r':3}
+
+@njit(cache=True)
+def _one_step_scalar(p, s, model, ploidy):
+    '''One generation backward (model codes in _one_step_codes)'''
+    if ploidy == 1: # haploid is same as multiplicative (Felsenstein, 2017)
+        return p / (1 + s - s * p)
+    if model == 0:
+        return p / (1 + (1 - p) * s)
+    if s <= 0:
+        return p
+    if model == 1:
+        a = s
+        b = 1 + s - 2 * p * s
+    elif model == 2:
+        a = p * s
+        b = 1 + s - 2 * p * s
+    else:
+        a = (1 - p) * s
+        b = 1.
+    c = - p
+    qf = - b + sqrt((b ** 2) - 4 * a * c)
+    return qf / 2 / a
+
+@njit(cache=True)
+def _deterministic_kernel(s, p0, sizes, model, ploidy, t, sv):
+    '''Deterministic branch of walk_variant_backward'''
+    ps = np.empty(sizes.shape[0])
+    ps[0] = p0
+    p = p0
+    L = 1
+    for G in range(1, sizes.shape[0]):
+        N = sizes[G]
+        if G > t:
+            p = _one_step_scalar(p, s, model, ploidy)
+        x = floor(p * ploidy * N)
+        if x < 1:
+            break
+        if p >= 1:
+            break
+        if p <= sv:
+            s = 0.
+        ps[L] = p
+        L += 1
+    return ps[:L]
+
+# each entry keeps a trajectory as long as the demography,
+# so keep few and let callers clear them (sweep_grid.cache_clear())
+@lru_cache(maxsize=1024)
+def _deterministic_cached(s, p0, Ne, model, t, sv, ploidy):
+    ps = _deterministic_kernel(s, p0, Ne.sizes, model, ploidy, t, sv)
+    ps.flags.writeable = False
+    return ps
+
+def deterministic_trajectory(s, p0, Ne, one_step_model = 'a', tau0 = 0, sv=-0.01, ploidy = 2):
+    '''Deterministic variant frequencies backward in time
+
+    Compiled with numba (if installed) and memoized
+    on (s, p0, Ne, one_step_model, tau0, sv, ploidy)
+
+    Parameters
+    ----------
+    Same as walk_variant_backward
+
+    Returns
+    -------
+    numpy.ndarray
+        Read-only frequencies until loss or fixation
+    '''
+    assert ploidy in [1,2]
+    assert one_step_model in ['m','a','r','d']
+    assert p0 <= 1
+    assert p0 >= 0
+    assert sv < 1
+    return _deterministic_cached(float(s),
+                                 float(p0),
+                                 as_demography(Ne),
+                                 _one_step_codes[one_step_model],
+                                 floor(tau0),
+                                 float(sv),
+                                 int(ploidy),
+                                 )
+
+def sweep_grid(ss, p: float, Ne: dict | Demography, gens: list, one_step_model = 'm', tau0 = 0, sv=-0.01, ploidy = 2):
+    '''Deterministic sweeps for a grid of selection coefficients
+
+    Parameters
+    ----------
+    ss : array-like
+        Selection coefficients
+    p : float
+        Variant frequency at generation 0
+    Ne : dict or Demography
+        Effective population sizes
+    gens : numpy.ndarray
+        Generations to sample
+    one_step_model, tau0, sv, ploidy
+        Same as walk_variant_backward
+
+    Returns
+    -------
+    numpy.ndarray
+        (len(ss)) x (len(gens) - 1) frequencies, as in sweep
+    '''
+    Ne = as_demography(Ne)
+    gens = np.asarray(gens)
+    ss = np.asarray(ss, dtype=float).ravel()
+    x = np.empty((ss.shape[0], gens.shape[0] - 1))
+    for i in range(ss.shape[0]):
+        x0 = deterministic_trajectory(ss[i], p, Ne, one_step_model, tau0, sv, ploidy)
+        x[i] = pad_trajectories(x0, gens[1:]) # address fixation of allele
+    return x
+
+# free the memoized trajectories
+sweep_grid.cache_clear = _deterministic_cached.cache_clear
+deterministic_trajectory.cache_clear = _deterministic_cached.cache_clear
+
 def bootstrap(num_rep: int,
               s_start: float,
               s_step: float,
@@ -206,44 +561,166 @@ def bootstrap(num_rep: int,
               p_start: float,
               p_step: float,
               p_end : float,
-              Ne: dict,
+              Ne: dict | Demography,
               gens: list,
-              sizes: list
+              sizes: list,
+              rng=None,
               ):
+    if rng is None:
+        rng = _global_rng()
     ss = np.arange(s_start,s_end,s_step)
     N = num_rep
     ps = np.arange(p_start,p_end,p_step)
-    M = N*len(ss)*len(ps)
-    y_array = np.zeros((M,1),dtype=np.float32)
-    x_array = np.zeros((M,gens.shape[0]),dtype=np.float32)
-    j = 0
-    for p in ps:
-        for s in ss:
-            for n in range(N):
-                y = s
-                x0, _, _ = walk_variant_backward(y,p,Ne,random_walk=True,one_step_model='m') # wright fisher process
-                # address fixation of allele
-                last_element = x0[-1] # Get the last element of the array
-                extension = np.full(gens[-1], last_element) # Create an array of the same value
-                extended_arr = np.append(x0, extension) # Extend the original array
-                x = extended_arr[gens]
-                x_sampled = np.random.binomial(sizes,x) / sizes
-                x_array[j,:] = x_sampled
-                y_array[j] = y
-                j += 1
-    x_data = torch.from_numpy(x_array)
-    y_data = torch.from_numpy(y_array)
+    Ne = as_demography(Ne)
+    # rows ordered by p, then s, then replicate
+    y = np.tile(np.repeat(ss, N), len(ps)) # replicates of each s
+    p = np.repeat(ps, N*len(ss))
+    x0, _ = walk_variants_backward(y,p,Ne,random_walk=True,one_step_model='m',rng=rng) # wright fisher process
+    x = pad_trajectories(x0, gens) # address fixation of allele
+    x_sampled = rng.binomial(sizes,x) / sizes
+    x_data = torch.from_numpy(x_sampled.astype(np.float32))
+    y_data = torch.from_numpy(y.astype(np.float32).reshape(-1,1))
     return x_data, y_data
 
+def _bootstrap_shard(k, start, stop, num_rep, ss, ps, Ne, gens, sizes, entropy):
+    '''Simulate rows start to stop of the bootstrap grid'''
+    rng = np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(k,)))
+    rows = np.arange(start, stop)
+    y = ss[(rows // num_rep) % ss.shape[0]]
+    p = ps[rows // (num_rep * ss.shape[0])]
+    x0, _ = walk_variants_backward(y,p,Ne,random_walk=True,one_step_model='m',rng=rng) # wright fisher process
+    x = pad_trajectories(x0, gens) # address fixation of allele
+    x_sampled = rng.binomial(sizes,x) / sizes
+    return x_sampled.astype(np.float32), y.astype(np.float32).reshape(-1,1)
+
+def bootstrap_shards(num_rep: int,
+                     s_start: float,
+                     s_step: float,
+                     s_end: float,
+                     p_start: float,
+                     p_step: float,
+                     p_end : float,
+                     Ne: dict | Demography,
+                     gens: list,
+                     sizes: list,
+                     shard_size: int = 4096,
+                     seed=None,
+                     num_workers: int = 1,
+                     shards=None,
+                     ):
+    '''Stream the bootstrap training set in fixed-size shards
+
+    Rows are in the same p, s, replicate order as bootstrap.
+    Shard k draws from its own SeedSequence spawn, so the output
+    is the same for any number of workers.
+
+    Parameters
+    ----------
+    num_rep, s_start, s_step, s_end, p_start, p_step, p_end, Ne, gens, sizes
+        Same as bootstrap
+    shard_size : int
+        Rows per shard (the last shard may be smaller)
+    seed : int or numpy.random.SeedSequence
+        Root seed (Default None draws fresh entropy)
+    num_workers : int
+        Size of the process pool (1 runs in this process)
+    shards : iterable
+        Shard indices to simulate (Default None for all)
+
+    Yields
+    ------
+    tuple
+        torch tensors for x and y of one shard
+    '''
+    ss = np.arange(s_start,s_end,s_step)
+    ps = np.arange(p_start,p_end,p_step)
+    M = num_rep*len(ss)*len(ps)
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    entropy = seed.entropy
+    if shards is None:
+        shards = range(ceil(M / shard_size))
+    Ne = as_demography(Ne)
+    tasks = ((k, k*shard_size, min((k+1)*shard_size, M), num_rep, ss, ps, Ne, gens, sizes, entropy)
+             for k in shards)
+
+    if num_workers <= 1:
+        for task in tasks:
+            x, y = _bootstrap_shard(*task)
+            yield torch.from_numpy(x), torch.from_numpy(y)
+        return
+
+    # keep a bounded number of shards in flight
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(_bootstrap_shard, *task))
+            if len(pending) >= 2 * num_workers:
+                x, y = pending.popleft().result()
+                yield torch.from_numpy(x), torch.from_numpy(y)
+        while pending:
+            x, y = pending.popleft().result()
+            yield torch.from_numpy(x), torch.from_numpy(y)
+
+class BootstrapDataset(IterableDataset):
+    '''Bootstrap training set as a torch IterableDataset
+
+    Yields (x, y) rows simulated by bootstrap_shards.
+    With DataLoader workers each worker takes every
+    num_workers-th shard, otherwise a process pool
+    of size num_workers builds the shards.
+
+    Parameters
+    ----------
+    *args
+        Same as bootstrap
+    shard_size : int
+        Rows per shard
+    seed : int
+        Root seed (Default None draws fresh entropy once)
+    num_workers : int
+        Size of the process pool
+    '''
+
+    def __init__(self, *args, shard_size=4096, seed=None, num_workers=1):
+        super().__init__()
+        self.args = args
+        self.shard_size = shard_size
+        self.seed = np.random.SeedSequence(seed)
+        self.num_workers = num_workers
+        num_rep, s_start, s_step, s_end, p_start, p_step, p_end = args[:7]
+        self.num_rows = num_rep * len(np.arange(s_start,s_end,s_step)) * len(np.arange(p_start,p_end,p_step))
+
+    def __len__(self):
+        return self.num_rows
+
+    def __iter__(self):
+        num_shards = ceil(self.num_rows / self.shard_size)
+        info = get_worker_info()
+        if info is None:
+            shards = range(num_shards)
+            num_workers = self.num_workers
+        else:
+            shards = range(info.id, num_shards, info.num_workers)
+            num_workers = 1
+        for x, y in bootstrap_shards(*self.args,
+                                     shard_size=self.shard_size,
+                                     seed=self.seed,
+                                     num_workers=num_workers,
+                                     shards=shards):
+            for i in range(x.shape[0]):
+                yield x[i], y[i]
+
 def bootstrap_interval(model,
                        nboot: int,
                        prediction: float,
                        p: float,
-                       Ne: dict,
+                       Ne: dict | Demography,
                        gens: list,
                        sizes: list,
                        qlow=0.025,
                        qupp=0.975,
+                       rng=None,
                        ) -> list:
     x_data, _ = bootstrap(nboot,
                           prediction,
@@ -255,6 +732,7 @@ def bootstrap_interval(model,
                           Ne,
                           gens,
                           sizes,
+                          rng,
                           )
     y_boot = model(x_data)
     y_boot = y_boot.cpu().detach().numpy()
@@ -262,12 +740,215 @@ def bootstrap_interval(model,
     yupp = np.quantile(y_boot, qupp)
     return ylow, yupp
 
-def sweep(s: float,p: float,Ne: dict,gens: list):
-    x0, _, _ = walk_variant_backward(s,p,Ne,random_walk=False,one_step_model='m') # wright fisher process
-    last_element = x0[-1] # Get the last element of the array
-    extension = np.full(gens[-1], last_element) # Create an array of the same value
-    extended_arr = np.append(x0, extension) # Extend the original array
-    x = extended_arr[gens]
+def write_shards(folder, shards, metadata=None):
+    '''Write (x, y) shards as .npy files with a JSON index
+
+    Parameters
+    ----------
+    folder : str
+        Output folder (made if missing)
+    shards : iterable
+        (x, y) arrays or tensors, e.g. from bootstrap_shards
+    metadata : dict
+        JSON-serializable description of the data
+
+    Returns
+    -------
+    dict
+        The index, also written to folder/index.json
+    '''
+    os.makedirs(folder, exist_ok=True)
+    entries = []
+    offset = 0
+    for k, (x, y) in enumerate(shards):
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        y = np.ascontiguousarray(y, dtype=np.float32)
+        assert x.shape[0] == y.shape[0]
+        xfile = 'x' + str(k) + '.npy'
+        yfile = 'y' + str(k) + '.npy'
+        np.save(os.path.join(folder, xfile), x)
+        np.save(os.path.join(folder, yfile), y)
+        entries.append({'x': xfile, 'y': yfile, 'offset': offset, 'rows': x.shape[0]})
+        offset += x.shape[0]
+    index = {'num_rows': offset,
+             'shards': entries,
+             'metadata': {} if metadata is None else metadata,
+             }
+    with open(os.path.join(folder, 'index.json'), 'w') as f:
+        json.dump(index, f, indent=1)
+    return index
+
+def write_bootstrap_shards(folder,
+                           num_rep: int,
+                           s_start: float,
+                           s_step: float,
+                           s_end: float,
+                           p_start: float,
+                           p_step: float,
+                           p_end : float,
+                           Ne: dict | Demography,
+                           gens: list,
+                           sizes: list,
+                           shard_size: int = 4096,
+                           seed=None,
+                           num_workers: int = 1,
+                           ):
+    '''Simulate bootstrap_shards once and write them to folder
+
+    The bootstrap settings and seed entropy go in the index metadata
+    '''
+    Ne = as_demography(Ne)
+    seed = np.random.SeedSequence(seed)
+    metadata = {'num_rep': num_rep,
+                's': [s_start, s_step, s_end],
+                'p': [p_start, p_step, p_end],
+                'Ne': Ne.sizes.tolist(),
+                'gens': np.asarray(gens).tolist(),
+                'sizes': np.asarray(sizes).tolist(),
+                'shard_size': shard_size,
+                'seed_entropy': seed.entropy,
+                }
+    shards = bootstrap_shards(num_rep, s_start, s_step, s_end, p_start, p_step, p_end,
+                              Ne, gens, sizes,
+                              shard_size=shard_size, seed=seed, num_workers=num_workers)
+    return write_shards(folder, shards, metadata)
+
+class ShardDataset(Dataset):
+    '''Memory-mapped dataset of shards from write_shards
+
+    Shards are opened copy-on-write, so rows come back
+    as tensors that share memory with the files.
+
+    Parameters
+    ----------
+    folder : str
+        Folder with index.json
+    '''
+
+    def __init__(self, folder):
+        super().__init__()
+        self.folder = folder
+        with open(os.path.join(folder, 'index.json'), 'r') as f:
+            self.index = json.load(f)
+        self.metadata = self.index['metadata']
+        self.offsets = np.array([e['offset'] for e in self.index['shards']], dtype=np.int64)
+        self._arrays = None
+
+    def _open(self):
+        # opened lazily so each DataLoader worker maps its own
+        self._arrays = [(np.load(os.path.join(self.folder, e['x']), mmap_mode='c'),
+                         np.load(os.path.join(self.folder, e['y']), mmap_mode='c'))
+                        for e in self.index['shards']]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_arrays'] = None
+        return state
+
+    def __len__(self):
+        return self.index['num_rows']
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError(i)
+        if self._arrays is None:
+            self._open()
+        k = np.searchsorted(self.offsets, i, side='right') - 1
+        x, y = self._arrays[k]
+        j = i - self.offsets[k]
+        return torch.from_numpy(x[j]), torch.from_numpy(y[j])
+
+def _predict(model, x, batch_size):
+    '''Model outputs in minibatches without autograd'''
+    try:
+        device = next(model.parameters()).device
+    except (AttributeError, StopIteration):
+        device = torch.device('cpu')
+    x = torch.from_numpy(x)
+    y = np.empty(x.shape[0], dtype=np.float32)
+    with torch.inference_mode():
+        for i in range(0, x.shape[0], batch_size):
+            yb = model(x[i:(i+batch_size)].to(device))
+            y[i:(i+batch_size)] = yb.reshape(-1).cpu().numpy()
+    return y
+
+def bootstrap_intervals(model,
+                        nboot: int,
+                        predictions,
+                        p,
+                        Ne: dict | Demography,
+                        gens: list,
+                        sizes: list,
+                        qs=(0.025, 0.975),
+                        s_resolution=0.001,
+                        p_resolution=0.01,
+                        batch_size=65536,
+                        rng=None,
+                        ):
+    '''Bootstrap intervals for many predictions at once
+
+    Predictions (and starting frequencies) are rounded to a grid,
+    and each grid cell shares one set of nboot replicates.
+
+    Parameters
+    ----------
+    model : torch.nn.Module
+    nboot : int
+        Replicates per grid cell
+    predictions : array-like
+        Predicted selection coefficients
+    p : float or array-like
+        Variant frequency at generation 0 (one or per prediction)
+    Ne : dict or Demography
+        Effective population sizes
+    gens : numpy.ndarray
+        Generations to sample
+    sizes : numpy.ndarray
+        Sample sizes at gens
+    qs : tuple
+        Quantiles
+    s_resolution : float
+        Grid step for predictions
+    p_resolution : float
+        Grid step for p
+    batch_size : int
+        Most rows simulated or scored at a time
+    rng : numpy.random.Generator
+        Random number generator (Default None seeds one from np.random)
+
+    Returns
+    -------
+    numpy.ndarray
+        (len(predictions)) x (len(qs)) quantiles
+    '''
+    if rng is None:
+        rng = _global_rng()
+    Ne = as_demography(Ne)
+    predictions, p = np.broadcast_arrays(np.asarray(predictions, dtype=float).ravel(),
+                                         np.asarray(p, dtype=float).ravel())
+    keys = np.column_stack((np.rint(predictions / s_resolution),
+                            np.rint(p / p_resolution))).astype(np.int64)
+    cells, inverse = np.unique(keys, axis=0, return_inverse=True)
+    s_cells = cells[:,0] * s_resolution
+    p_cells = np.clip(cells[:,1] * p_resolution, 0, 1)
+
+    quantiles = np.empty((cells.shape[0], len(qs)))
+    step = max(1, batch_size // nboot) # cells per batch
+    for i in range(0, cells.shape[0], step):
+        y = np.repeat(s_cells[i:(i+step)], nboot)
+        p0 = np.repeat(p_cells[i:(i+step)], nboot)
+        x0, _ = walk_variants_backward(y,p0,Ne,random_walk=True,one_step_model='m',rng=rng) # wright fisher process
+        x = pad_trajectories(x0, gens) # address fixation of allele
+        x_sampled = (rng.binomial(sizes,x) / sizes).astype(np.float32)
+        y_boot = _predict(model, x_sampled, batch_size).reshape(-1, nboot)
+        quantiles[i:(i+step)] = np.quantile(y_boot, qs, axis=1).T
+    return quantiles[inverse.ravel()]
+
+def sweep(s: float,p: float,Ne: dict | Demography,gens: list):
+    x0 = deterministic_trajectory(s,p,Ne,one_step_model='m') # wright fisher process
+    x = pad_trajectories(x0, gens) # address fixation of allele
     return x[1:]
 
 def plot_scatter_pred(predicted, actual, downsample_prop=1.):
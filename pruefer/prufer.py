@@ -1,8 +1,16 @@
-from collections import defaultdict, deque
+from collections import defaultdict
 import heapq
 import numpy as np
 from numpy.typing import NDArray
 import random
+try:
+    from numba import njit, prange
+except ImportError: # run the kernels as plain python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda f: f
+    prange = range
 
 # I wrote this function
 def format_topology(tree: list) -> list:
@@ -60,26 +68,214 @@ def prufer_to_topology(prufer_sequence: NDArray[np.int_]) -> list:
         degree[node - 1] += 1
     
     # Priority queue to find the smallest node with degree 1
-    leaf_nodes = deque(node for node in range(n) if degree[node] == 1)
+    leaf_nodes = [node for node in range(n) if degree[node] == 1]
+    heapq.heapify(leaf_nodes)
 
     tree = []
 
     for node in prufer_sequence:
-        leaf = leaf_nodes.popleft()
+        leaf = heapq.heappop(leaf_nodes)
         tree.append((leaf + 1, node))
         
         degree[leaf] -= 1
         degree[node - 1] -= 1
         
         if degree[node - 1] == 1:
-            leaf_nodes.append(node - 1)
+            heapq.heappush(leaf_nodes, node - 1)
     
     # Connecting the last two remaining nodes
-    leaf_nodes = [x + 1 for x in leaf_nodes]
+    leaf_nodes = sorted(x + 1 for x in leaf_nodes)
     tree.append((leaf_nodes[0], leaf_nodes[1]))
 
     return format_topology(tree)
 
+# Linear time versions of topology_to_prufer and prufer_to_topology
+# Nodes are labelled 1, ..., n and parent arrays have length n + 1
+# with parent[0] unused and parent[n] = 0 for the root
+
+@njit(cache=True)
+def _edges_to_parents(edges, n):
+    '''Parent array of the tree rooted at node n'''
+    # adjacency in compressed sparse row format
+    degree = np.zeros(n + 1, dtype=np.int64)
+    for e in range(edges.shape[0]):
+        degree[edges[e, 0]] += 1
+        degree[edges[e, 1]] += 1
+    start = np.zeros(n + 2, dtype=np.int64)
+    for v in range(1, n + 1):
+        start[v + 1] = start[v] + degree[v]
+    fill = start.copy()
+    adjacent = np.empty(2 * edges.shape[0], dtype=np.int64)
+    for e in range(edges.shape[0]):
+        u = edges[e, 0]
+        v = edges[e, 1]
+        adjacent[fill[u]] = v
+        fill[u] += 1
+        adjacent[fill[v]] = u
+        fill[v] += 1
+    # depth first search from the root
+    parent = np.zeros(n + 1, dtype=np.int64)
+    stack = np.empty(n, dtype=np.int64)
+    stack[0] = n
+    top = 1
+    while top > 0:
+        top -= 1
+        u = stack[top]
+        for k in range(start[u], start[u + 1]):
+            v = adjacent[k]
+            if v != parent[u]:
+                parent[v] = u
+                stack[top] = v
+                top += 1
+    return parent, degree
+
+@njit(cache=True)
+def _parents_to_prufer(parent, degree):
+    '''Remove the smallest leaf n - 2 times (degree is modified)'''
+    n = parent.shape[0] - 1
+    prufer = np.empty(n - 2, dtype=np.int64)
+    ptr = 1
+    while degree[ptr] != 1:
+        ptr += 1
+    leaf = ptr
+    for i in range(n - 2):
+        elder = parent[leaf]
+        prufer[i] = elder
+        degree[elder] -= 1
+        if degree[elder] == 1 and elder < ptr:
+            leaf = elder
+        else:
+            ptr += 1
+            while degree[ptr] != 1:
+                ptr += 1
+            leaf = ptr
+    return prufer
+
+@njit(cache=True)
+def _prufer_to_parents(prufer):
+    '''Attach the smallest leaf to each entry in turn'''
+    n = prufer.shape[0] + 2
+    degree = np.ones(n + 1, dtype=np.int64)
+    degree[0] = 0
+    for i in range(n - 2):
+        degree[prufer[i]] += 1
+    parent = np.zeros(n + 1, dtype=np.int64)
+    ptr = 1
+    while degree[ptr] != 1:
+        ptr += 1
+    leaf = ptr
+    for i in range(n - 2):
+        elder = prufer[i]
+        parent[leaf] = elder
+        degree[elder] -= 1
+        if degree[elder] == 1 and elder < ptr:
+            leaf = elder
+        else:
+            ptr += 1
+            while degree[ptr] != 1:
+                ptr += 1
+            leaf = ptr
+    parent[leaf] = n
+    return parent
+
+def edges_to_parents(tree) -> NDArray[np.int_]:
+    '''Parent array of tree topology rooted at its largest node'''
+    edges = np.ascontiguousarray(tree, dtype=np.int64).reshape(-1, 2)
+    parent, _ = _edges_to_parents(edges, edges.shape[0] + 1)
+    return parent
+
+def parents_to_edges(parent: NDArray[np.int_]) -> NDArray[np.int_]:
+    '''Tree topology as (n-1) x 2 array of sorted (min, max) rows'''
+    parent = np.asarray(parent)
+    child = np.nonzero(parent)[0]
+    lo = np.minimum(child, parent[child])
+    hi = np.maximum(child, parent[child])
+    order = np.lexsort((hi, lo))
+    return np.column_stack((lo[order], hi[order]))
+
+def parents_to_prufer(parent: NDArray[np.int_]) -> NDArray[np.int_]:
+    '''Convert parent array to Pruefer sequence in O(n)'''
+    parent = np.ascontiguousarray(parent, dtype=np.int64)
+    degree = np.bincount(parent[1:], minlength=parent.shape[0]) + 1
+    degree[0] = 0
+    degree[parent.shape[0] - 1] -= 1 # root has no parent
+    return _parents_to_prufer(parent, degree)
+
+def prufer_to_parents(prufer: NDArray[np.int_]) -> NDArray[np.int_]:
+    '''Convert Pruefer sequence to parent array in O(n)'''
+    return _prufer_to_parents(np.ascontiguousarray(prufer, dtype=np.int64))
+
+def fast_topology_to_prufer(tree) -> NDArray[np.int_]:
+    '''Linear time topology_to_prufer for nodes 1, ..., n'''
+    edges = np.ascontiguousarray(tree, dtype=np.int64).reshape(-1, 2)
+    parent, degree = _edges_to_parents(edges, edges.shape[0] + 1)
+    return _parents_to_prufer(parent, degree)
+
+def fast_prufer_to_topology(prufer: NDArray[np.int_]) -> NDArray[np.int_]:
+    '''Linear time prufer_to_topology returning an integer array'''
+    return parents_to_edges(prufer_to_parents(prufer))
+
+@njit(parallel=True, cache=True)
+def _topologies_to_prufer(edges):
+    B = edges.shape[0]
+    n = edges.shape[1] + 1
+    prufers = np.empty((B, n - 2), dtype=np.int32)
+    for b in prange(B):
+        parent, degree = _edges_to_parents(edges[b], n)
+        prufers[b] = _parents_to_prufer(parent, degree)
+    return prufers
+
+@njit(parallel=True, cache=True)
+def _prufer_to_parents_batch(prufers):
+    B = prufers.shape[0]
+    n = prufers.shape[1] + 2
+    parents = np.empty((B, n + 1), dtype=np.int64)
+    for b in prange(B):
+        parents[b] = _prufer_to_parents(prufers[b])
+    return parents
+
+def topologies_to_prufer(edges) -> NDArray[np.int32]:
+    '''Convert B tree topologies to Pruefer sequences
+
+    Parameters
+    ----------
+    edges : array-like
+        B x (n-1) x 2 edges of trees on nodes 1, ..., n
+
+    Returns
+    -------
+    numpy.array(dtype=np.int32)
+        B x (n-2) Pruefer sequences
+    '''
+    edges = np.ascontiguousarray(edges, dtype=np.int64)
+    assert edges.ndim == 3 and edges.shape[2] == 2
+    return _topologies_to_prufer(edges)
+
+def prufer_to_topologies(prufers) -> NDArray[np.int32]:
+    '''Convert B Pruefer sequences to tree topologies
+
+    Parameters
+    ----------
+    prufers : array-like
+        B x (n-2) Pruefer sequences
+
+    Returns
+    -------
+    numpy.array(dtype=np.int32)
+        B x (n-1) x 2 edges as sorted (min, max) rows
+    '''
+    prufers = np.ascontiguousarray(prufers, dtype=np.int64)
+    assert prufers.ndim == 2
+    parents = _prufer_to_parents_batch(prufers)
+    n = prufers.shape[1] + 2
+    child = np.arange(1, n)
+    lo = np.minimum(child, parents[:, 1:n])
+    hi = np.maximum(child, parents[:, 1:n])
+    order = np.argsort(lo * (n + 1) + hi, axis=1)
+    lo = np.take_along_axis(lo, order, axis=1)
+    hi = np.take_along_axis(hi, order, axis=1)
+    return np.stack((lo, hi), axis=2).astype(np.int32)
+
 # From UMich GPT service
 def simulate_coalescent(n):
     """
@@ -121,101 +317,107 @@ def simulate_coalescent(n):
 
     return format_topology(edges), ancestral_times
 
-# def simulate_prufer(n: int) -> NDArray[np.int_]:
-#     '''Simulate a Pruefer sequence for coalescent tree topology'''
-
-#     # set up labels
-#     arr1 = np.arange(n+1,2*n-1,1)
-#     arr2 = np.arange(n+1,2*n-1,1)
-#     arr = np.sort(
-#         np.concatenate((arr1,
-#                         arr2,
-#                         np.array([2*n-1]))
-#                         )
-#         )
-#     print(arr.shape)
-    
-#     # # initial labels fully random
-#     # idxs = np.random.choice(np.arange(n),
-#     #                         n-2,
-#     #                         replace=False)
-#     # seq = arr[idxs]
-#     # arr = np.delete(arr,idxs)
-
-#     idx = np.random.choice(np.arange(arr.shape[0]),1)
-#     seq = np.array(arr[idx])
-#     arr = np.delete(arr,idx)
-#     print(seq)
-#     print(arr)
-
-#     # enforce coalescent tree conditions
-#     for i in np.arange(2*n-3):
-#         try:
-#             j = i + 2
-#             sm = (seq <= (j + 0.5)).sum()
-#             if sm > 1:
-#                 seq = np.concatenate((seq,[j,j]))
-#                 arr = np.delete(arr,[0])
-#                 arr = np.delete(arr,[0])
-#             elif sm > 0:
-#                 seq = np.concatenate((seq,[j]))
-#                 arr = np.delete(arr,[0])
-#             else:
-#                 idx = np.random.choice(np.arange(arr.shape[0]),1)
-#                 seq = arr[idx]
-#                 arr = np.delete(arr,idx)
-#         except ValueError:
-#             pass
-#     return seq
-
-
-
-    # for must in range(n+1,2*n):
-
-    #     if arr.shape[0] <= 1:
-    #         print(seq,arr)
-    #         seq = np.concatenate((seq,arr))
-    #         break
-
-    #     print(seq,arr)
-
-    #     sm = ((seq > must - 1) & ((seq < must + 1))).sum()
-    #     if sm <= 0:
-    #         # must choose two specific nodes 
-    #         seq = np.concatenate((seq,[must,must]))
-    #         arr = np.delete(arr,[0,1])
-
-    #     elif sm >= 2:
-    #         # can choose two nodes randomly
-    #         idx = np.random.choice(np.arange(arr.shape[0]),2,replace=False)
-    #         seq = np.concatenate((seq,arr[idx]))
-    #         arr = np.delete(arr,idx)
-
-    #     else:
-    #         # choose one node randomly
-    #         seq = np.concatenate((seq,[must]))
-    #         arr = np.delete(arr,0)
-    #         idx = np.random.choice(np.arange(arr.shape[0]),1)
-    #         seq = np.concatenate((seq,arr[idx]))
-    #         arr = np.delete(arr,idx)
-    #         # sm = ((seq > must - 1) & ((seq < must + 1))).sum()
-    #         # if sm >= 2:
-    #         #     # can choose node randomly
-    #         #     idx = np.random.choice(np.arange(arr.shape[0]),1)
-    #         #     seq = np.concatenate((seq,arr[idx]))
-    #         #     arr = np.delete(arr,idx)
-    #         # else:
-    #         #     # must choose specific node
-    #         #     seq = np.concatenate((seq,[must]))
-    #         #     arr = np.delete(arr,0)
-
-    # return seq
+@njit(cache=True)
+def _coalescent_parents(n, u):
+    '''Parent array of a coalescent tree from (n-1) x 2 uniforms'''
+    parent = np.zeros(2 * n, dtype=np.int64)
+    lineages = np.arange(1, n + 1)
+    for e in range(n - 1):
+        k = n - e
+        # swap the first pick with the last lineage
+        i = int(u[e, 0] * k)
+        first = lineages[i]
+        lineages[i] = lineages[k - 1]
+        j = int(u[e, 1] * (k - 1))
+        second = lineages[j]
+        node = n + 1 + e
+        parent[first] = node
+        parent[second] = node
+        lineages[j] = node
+    return parent
+
+def coalescent_times(n: int, rng=None) -> NDArray[np.float64]:
+    '''Coalescence times of a sample of size n in one call'''
+    if rng is None:
+        rng = np.random.default_rng()
+    k = np.arange(n, 1, -1)
+    return np.cumsum(rng.exponential(2 / (k * (k - 1))))
+
+def simulate_coalescent_parents(n: int, rng=None) -> NDArray[np.int_]:
+    '''Simulate a coalescent tree topology as a parent array
+
+    Samples are nodes 1, ..., n and internal nodes
+    n+1, ..., 2n-1 are labelled in order of time
+    '''
+    if rng is None:
+        rng = np.random.default_rng()
+    return _coalescent_parents(n, rng.random((n - 1, 2)))
+
+def simulate_coalescent_fast(n: int, rng=None):
+    '''O(n) simulate_coalescent from one numpy.random.Generator
+
+    Returns:
+        edges: (2n-2) x 2 array in the order of format_topology.
+        ancestral_times: Array of times at which coalescent events occur.
+    '''
+    if rng is None:
+        rng = np.random.default_rng()
+    times = coalescent_times(n, rng)
+    parent = simulate_coalescent_parents(n, rng)
+    return parents_to_edges(parent), times
+
+@njit(parallel=True, cache=True)
+def _coalescent_prufers(n, u):
+    '''Pruefer sequences of B coalescent trees from B x (n-1) x 2 uniforms'''
+    B = u.shape[0]
+    prufers = np.empty((B, 2 * n - 3), dtype=np.int32)
+    for b in prange(B):
+        lineages = np.arange(1, n + 1)
+        for e in range(n - 1):
+            k = n - e
+            i = int(u[b, e, 0] * k)
+            first = lineages[i]
+            lineages[i] = lineages[k - 1]
+            j = int(u[b, e, 1] * (k - 1))
+            second = lineages[j]
+            node = n + 1 + e
+            # node 2n-2 is the last one left, so it is not in the sequence
+            if first < 2 * n - 2:
+                prufers[b, first - 1] = node
+            if second < 2 * n - 2:
+                prufers[b, second - 1] = node
+            lineages[j] = node
+    return prufers
+
+def simulate_prufers(B: int, n: int, rng=None) -> NDArray[np.int32]:
+    '''Simulate B coalescent Pruefer sequences directly
+
+    With internal nodes labelled in order of time, every node
+    becomes the smallest leaf in label order, so the Pruefer
+    sequence is the parents of nodes 1, ..., 2n-3.
+    No edge list is built.
+
+    Parameters
+    ----------
+    B : int
+        Number of trees
+    n : int
+        Sample size
+    rng : numpy.random.Generator
+
+    Returns
+    -------
+    numpy.array(dtype=np.int32)
+        B x (2n-3) Pruefer sequences
+    '''
+    if rng is None:
+        rng = np.random.default_rng()
+    return _coalescent_prufers(n, rng.random((B, n - 1, 2)))
 
 # I wrote this function
-def simulate_prufer(n: int) -> NDArray[np.int_]:
+def simulate_prufer(n: int, rng=None) -> NDArray[np.int_]:
     '''Simulate a coalescent tree topology'''
-    topology, _ = simulate_coalescent(n)
-    return topology_to_prufer(topology)
+    return simulate_prufers(1, n, rng)[0].astype(np.int64)
 
 # I wrote this function
 def prufer_there_and_back_again(prufer: list) -> float:
@@ -239,4 +441,93 @@ def valid_prufer(prufer: list) -> bool:
     two, _ = np.unique(interiors, return_counts = True)
     assert two.shape == (1,)
     assert two[0] == 2
-    return None
\ No newline at end of file
+    return None
+
+
+_prufer_reasons = np.array(['',
+                            'length',
+                            'out of range',
+                            'root count',
+                            'interior count',
+                            ])
+
+def valid_prufers(prufers, chunk_size: int = 65536):
+    '''Batch valid_prufer that returns reasons instead of raising
+
+    Rows must use nodes n+1, ..., 2n-1 only, with two of
+    each interior node and one of the root 2n-1
+
+    Parameters
+    ----------
+    prufers : array-like
+        B x (2n-3) Pruefer sequences
+    chunk_size : int
+        Rows counted at a time
+
+    Returns
+    -------
+    tuple
+        Boolean mask of valid rows and
+        array of failure reasons ('' if valid)
+    '''
+    prufers = np.asarray(prufers)
+    B, L = prufers.shape
+    codes = np.zeros(B, dtype=np.int8)
+    if L % 2 == 0:
+        codes[:] = 1
+        return codes == 0, _prufer_reasons[codes]
+    n = (L + 3) // 2
+    root = 2 * n - 1
+    for start in range(0, B, chunk_size):
+        chunk = prufers[start:(start+chunk_size)].astype(np.int64)
+        rows = chunk.shape[0]
+        in_range = (chunk > n) & (chunk <= root)
+        bad_range = ~in_range.all(axis=1)
+        # count labels n+1, ..., 2n-1 in each row with one bincount
+        flat = np.where(in_range, chunk - n - 1, n - 1) + np.arange(rows)[:, None] * n
+        counts = np.bincount(flat.ravel(), minlength=rows * n).reshape(rows, n)
+        bad_root = counts[:, n - 2] != 1
+        bad_interior = (counts[:, :(n - 2)] != 2).any(axis=1)
+        code = np.where(bad_interior, 4, 0)
+        code = np.where(bad_root, 3, code)
+        code = np.where(bad_range, 2, code)
+        codes[start:(start+rows)] = code
+    return codes == 0, _prufer_reasons[codes]
+
+def prufers_there_and_back_again(prufers, num_samples=None, rng=None):
+    '''Batch prufer_there_and_back_again on a sample of rows
+
+    Decoding and encoding run in parallel numba loops.
+    Rows that fail valid_prufers are not decoded, as the
+    numba loops do not check labels, and count as not the same
+
+    Parameters
+    ----------
+    prufers : array-like
+        B x (2n-3) coalescent Pruefer sequences
+    num_samples : int
+        Rows to check (Default None checks all)
+    rng : numpy.random.Generator
+
+    Returns
+    -------
+    tuple
+        Indices of checked rows and
+        boolean mask of rows that came back the same
+    '''
+    prufers = np.asarray(prufers)
+    B = prufers.shape[0]
+    if num_samples is None or num_samples >= B:
+        idx = np.arange(B)
+    else:
+        if rng is None:
+            rng = np.random.default_rng()
+        idx = np.sort(rng.choice(B, num_samples, replace=False))
+    sample = prufers[idx]
+    valid, _ = valid_prufers(sample)
+    same = np.zeros(idx.shape[0], dtype=bool)
+    if valid.any():
+        checked = sample[valid]
+        inverse = topologies_to_prufer(prufer_to_topologies(checked))
+        same[valid] = (inverse == checked).all(axis=1)
+    return idx, same